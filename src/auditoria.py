@@ -1,16 +1,85 @@
 """Sistema de auditoría con registro tipo blockchain para trazabilidad"""
+import sys
 import time
-import json
-from collections import namedtuple
-from crypto_utils import hash_to_challenge
+import struct
+import hashlib
+from collections import namedtuple, deque, Counter
+import gmpy2
 
 RegistroEvento = namedtuple('RegistroEvento', ['timestamp', 'tipo', 'datos', 'hash_previo', 'hash_actual'])
 
+# Contexto SHA-256 que ya absorbió el prefijo de hoja + etiqueta de dominio;
+# cada hoja copia este estado en lugar de volver a procesar el prefijo
+_CTX_HOJA = hashlib.sha256(b'\x00AUDITORIA_VOTACION_ELGAMAL|')
+
+
+def _serializar(obj, buf):
+    """Agrega a buf la codificación binaria canónica de obj (etiqueta + longitud + contenido)"""
+    if obj is None:
+        buf += b'N'
+    elif obj is True:
+        buf += b'T'
+    elif obj is False:
+        buf += b'F'
+    elif isinstance(obj, (int, type(gmpy2.mpz(0)))):
+        obj = int(obj)
+        datos = obj.to_bytes((obj.bit_length() + 8) // 8, 'big', signed=True)
+        buf += b'I' + len(datos).to_bytes(4, 'big') + datos
+    elif isinstance(obj, float):
+        buf += b'R' + struct.pack('>d', obj)
+    elif isinstance(obj, str):
+        datos = obj.encode('utf-8')
+        buf += b'S' + len(datos).to_bytes(4, 'big') + datos
+    elif isinstance(obj, (bytes, bytearray)):
+        buf += b'B' + len(obj).to_bytes(4, 'big') + obj
+    elif isinstance(obj, (list, tuple)):
+        buf += b'L' + len(obj).to_bytes(4, 'big')
+        for elemento in obj:
+            _serializar(elemento, buf)
+    elif isinstance(obj, dict):
+        buf += b'D' + len(obj).to_bytes(4, 'big')
+        if all(type(clave) is str for clave in obj):
+            # Claves de texto: el orden por punto de código coincide con el de UTF-8
+            for clave in sorted(obj):
+                datos = clave.encode('utf-8')
+                buf += b'S' + len(datos).to_bytes(4, 'big') + datos
+                _serializar(obj[clave], buf)
+            return buf
+        # Claves mixtas: pares ordenados por la codificación de la clave
+        pares = []
+        for clave, valor in obj.items():
+            clave_buf = bytearray()
+            _serializar(clave, clave_buf)
+            pares.append((bytes(clave_buf), valor))
+        pares.sort(key=lambda par: par[0])
+        for clave_buf, valor in pares:
+            buf += clave_buf
+            _serializar(valor, buf)
+    else:
+        raise TypeError(f"Tipo no serializable en auditoría: {type(obj).__name__}")
+    return buf
+
+
+def serializar_canonico(obj):
+    """Codificación binaria determinista de los datos de un evento"""
+    return bytes(_serializar(obj, bytearray()))
+
 class SistemaAuditoria:
     """Registro inmutable de eventos electorales con cadena de hashes"""
     
-    def __init__(self):
+    def __init__(self, verbose=False, max_log=10000):
         self.eventos = []
+        # Log por evento opcional: las líneas se acumulan en memoria y se
+        # escriben de una sola vez con volcar_log() al final de cada fase
+        self.verbose = verbose
+        self._log = deque(maxlen=max_log)
+        # Conteo de eventos por tipo y resultado de la última verificación
+        # de integridad: (número de eventos verificados, resultado)
+        self._tipos_count = Counter()
+        self._integrity_cache = None
+        # Árbol de Merkle sobre los eventos: niveles de abajo hacia arriba (nivel 0 = hojas)
+        self.merkle_niveles = [[]]
+        self.merkle_hojas = self.merkle_niveles[0]
         self.hash_genesis = self._calcular_hash("GENESIS_BLOCK", 0, {})
         print("  ✓ Sistema de auditoría inicializado")
         print(f"    Hash génesis: {self.hash_genesis}")
@@ -18,9 +87,17 @@ class SistemaAuditoria:
     def registrar_evento(self, tipo, datos):
         """
         Registra un evento en la cadena de auditoría
-        Tipo: 'SETUP', 'REGISTRO', 'VOTO', 'MEZCLA', 'CONTEO'
+        Tipo: 'SETUP', 'REGISTRO', 'VOTO', 'MEZCLA', 'VOTOS_EXCLUIDOS', 'CONTEO'
         """
-        timestamp = int(time.time() * 1000)  # milisegundos
+        return self.registrar_eventos_bulk([(tipo, datos)])
+    
+    def registrar_eventos_bulk(self, eventos):
+        """
+        Registra en orden varios eventos (tipo, datos) en una sola pasada
+        Todos comparten la marca de tiempo y el árbol de Merkle se actualiza
+        una vez al final. Retorna el hash del último evento de la cadena.
+        """
+        timestamp = time.time_ns() // 1_000_000  # milisegundos
         
         # Obtener hash del evento previo
         if self.eventos:
@@ -28,47 +105,170 @@ class SistemaAuditoria:
         else:
             hash_previo = self.hash_genesis
         
-        # Calcular hash del evento actual
-        hash_actual = self._calcular_hash(tipo, timestamp, datos, hash_previo)
-        
-        # Crear y guardar evento
-        evento = RegistroEvento(
-            timestamp=timestamp,
-            tipo=tipo,
-            datos=datos,
-            hash_previo=hash_previo,
-            hash_actual=hash_actual
-        )
-        
-        self.eventos.append(evento)
-        
-        # Log simplificado
-        hash_corto = str(hash_actual)[:8]
-        print(f"  📋 Evento registrado: {tipo} (hash: {hash_corto}...)")
+        hojas = []
+        for tipo, datos in eventos:
+            # Calcular hash del evento actual y encadenarlo
+            hash_actual = self._calcular_hash(tipo, timestamp, datos, hash_previo)
+            self.eventos.append(RegistroEvento(
+                timestamp=timestamp,
+                tipo=tipo,
+                datos=datos,
+                hash_previo=hash_previo,
+                hash_actual=hash_actual
+            ))
+            self._tipos_count[tipo] += 1
+            hojas.append(self._hash_hoja(tipo, timestamp, datos))
+            
+            if self.verbose:
+                self._log.append(f"  📋 Evento registrado: {tipo} (hash: {str(hash_actual)[:8]}...)\n")
+            hash_previo = hash_actual
         
-        return hash_actual
+        self._agregar_hojas(hojas)
+        return hash_previo
+    
+    def volcar_log(self):
+        """Escribe en stdout las líneas de log acumuladas y vacía el buffer"""
+        if self._log:
+            sys.stdout.writelines(self._log)
+            sys.stdout.flush()
+            self._log.clear()
     
     def _calcular_hash(self, tipo, timestamp, datos, hash_previo=None):
         """Calcula hash criptográfico del evento"""
-        # Serializar datos de forma determinista
-        datos_str = json.dumps(datos, sort_keys=True) if isinstance(datos, dict) else str(datos)
+        buf = bytearray(tipo.encode('utf-8'))
+        buf += b'\0'
+        buf += timestamp.to_bytes(8, 'big')
+        _serializar(datos, buf)
+        if hash_previo:
+            buf += hash_previo.to_bytes(32, 'big')
+        return int.from_bytes(hashlib.sha256(buf).digest(), 'big')
+    
+    @staticmethod
+    def _hash_hoja(tipo, timestamp, datos):
+        """Hash de hoja del árbol de Merkle (prefijo 0x00 + etiqueta de dominio)"""
+        h = _CTX_HOJA.copy()
+        h.update(serializar_canonico([tipo, timestamp, datos]))
+        return h.digest()
+    
+    @staticmethod
+    def _hash_nodo(izquierdo, derecho):
+        """Hash de nodo interno del árbol de Merkle (prefijo 0x01, una sola llamada)"""
+        return hashlib.sha256(b'\x01' + izquierdo + derecho).digest()
+    
+    def _agregar_hojas(self, hojas):
+        """
+        Agrega varias hojas al árbol de Merkle; en cada nivel se recalculan
+        solo los nodos a partir del primer padre afectado
+        """
+        if len(hojas) == 1:
+            self._agregar_hoja(hojas[0])
+            return
+        niveles = self.merkle_niveles
+        inicio = len(niveles[0])
+        niveles[0].extend(hojas)
+        nivel = 0
         
-        # Combinar todos los componentes
-        componentes = [
-            tipo,
-            str(timestamp),
-            datos_str,
-            str(hash_previo) if hash_previo else ""
-        ]
+        while len(niveles[nivel]) > 1:
+            actual = niveles[nivel]
+            if nivel + 1 == len(niveles):
+                niveles.append([])
+            superior = niveles[nivel + 1]
+            inicio //= 2
+            del superior[inicio:]
+            for i in range(2 * inicio, len(actual) - 1, 2):
+                superior.append(self._hash_nodo(actual[i], actual[i + 1]))
+            if len(actual) % 2:
+                superior.append(actual[-1])
+            nivel += 1
+    
+    def _agregar_hoja(self, hoja):
+        """
+        Agrega una hoja al árbol de Merkle recalculando solo la rama derecha
+        (O(log N) por inserción). Un nodo sin hermano se promueve sin cambios.
+        """
+        niveles = self.merkle_niveles
+        niveles[0].append(hoja)
+        idx = len(niveles[0]) - 1
+        nivel = 0
         
-        # Usar nuestra función hash existente
-        return hash_to_challenge(*componentes)
+        while len(niveles[nivel]) > 1:
+            actual = niveles[nivel]
+            if idx % 2:
+                nodo = self._hash_nodo(actual[idx - 1], actual[idx])
+            else:
+                nodo = actual[idx]
+            
+            if nivel + 1 == len(niveles):
+                niveles.append([])
+            superior = niveles[nivel + 1]
+            padre = idx // 2
+            if padre < len(superior):
+                superior[padre] = nodo
+            else:
+                superior.append(nodo)
+            
+            nivel += 1
+            idx = padre
+    
+    @staticmethod
+    def _calcular_raiz(hojas):
+        """Calcula la raíz de Merkle de una lista de hojas, de abajo hacia arriba"""
+        if not hojas:
+            return None
+        nivel = list(hojas)
+        while len(nivel) > 1:
+            siguiente = [SistemaAuditoria._hash_nodo(nivel[i], nivel[i + 1])
+                         for i in range(0, len(nivel) - 1, 2)]
+            if len(nivel) % 2:
+                siguiente.append(nivel[-1])
+            nivel = siguiente
+        return nivel[0]
+    
+    def raiz_merkle(self):
+        """Retorna la raíz actual del árbol de Merkle (None si no hay eventos)"""
+        if not self.merkle_hojas:
+            return None
+        return self.merkle_niveles[-1][0]
+    
+    def prueba_inclusion(self, indice):
+        """
+        Genera la prueba de inclusión O(log N) del evento en la posición indice
+        Retorna: lista de (hash_hermano, hermano_a_la_izquierda)
+        """
+        if not 0 <= indice < len(self.merkle_hojas):
+            raise ValueError(f"No existe el evento {indice}")
+        
+        prueba = []
+        idx = indice
+        for nivel in self.merkle_niveles[:-1]:
+            hermano = idx ^ 1
+            if hermano < len(nivel):
+                prueba.append((nivel[hermano], hermano < idx))
+            idx //= 2
+        return prueba
+    
+    @staticmethod
+    def verificar_inclusion(evento, prueba, raiz):
+        """Verifica que un evento pertenece al árbol con la raíz dada"""
+        nodo = SistemaAuditoria._hash_hoja(evento.tipo, evento.timestamp, evento.datos)
+        for hermano, a_la_izquierda in prueba:
+            if a_la_izquierda:
+                nodo = SistemaAuditoria._hash_nodo(hermano, nodo)
+            else:
+                nodo = SistemaAuditoria._hash_nodo(nodo, hermano)
+        return nodo == raiz
     
     def verificar_integridad(self):
         """
         Verifica la integridad de toda la cadena de auditoría
         Retorna True si la cadena es válida, False si fue alterada
         """
+        resultado = self._verificar_cadena()
+        self._integrity_cache = (len(self.eventos), resultado)
+        return resultado
+    
+    def _verificar_cadena(self):
+        """Recorre y re-hashea todos los eventos (O(N))"""
         print("\n" + "="*70)
         print("VERIFICACIÓN DE INTEGRIDAD DE AUDITORÍA")
         print("="*70)
@@ -101,6 +301,12 @@ class SistemaAuditoria:
                 print(f"  ✗ Evento {i}: hash actual no coincide (posible alteración)")
                 return False
         
+        # Recalcular la raíz de Merkle desde las hojas y compararla
+        hojas = [self._hash_hoja(e.tipo, e.timestamp, e.datos) for e in self.eventos]
+        if self._calcular_raiz(hojas) != self.raiz_merkle():
+            print("  ✗ Raíz de Merkle no coincide (posible alteración)")
+            return False
+        
         print(f"  ✓ {len(self.eventos)} eventos verificados correctamente")
         print("  ✓ Cadena de auditoría íntegra")
         print("="*70)
@@ -111,6 +317,7 @@ class SistemaAuditoria:
         registro = {
             'hash_genesis': self.hash_genesis,
             'total_eventos': len(self.eventos),
+            'raiz_merkle': self.raiz_merkle().hex() if self.eventos else None,
             'eventos': []
         }
         
@@ -132,13 +339,8 @@ class SistemaAuditoria:
         print("="*70)
         print(f"Total de eventos registrados: {len(self.eventos)}")
         
-        # Contar por tipo
-        tipos = {}
-        for evento in self.eventos:
-            tipos[evento.tipo] = tipos.get(evento.tipo, 0) + 1
-        
         print("\nEventos por tipo:")
-        for tipo, count in sorted(tipos.items()):
+        for tipo, count in sorted(self._tipos_count.items()):
             print(f"  {tipo}: {count}")
         
         if self.eventos:
@@ -151,15 +353,22 @@ class SistemaAuditoria:
         """Retorna todos los eventos de un tipo específico"""
         return [e for e in self.eventos if e.tipo == tipo]
     
-    def obtener_estadisticas(self):
-        """Retorna estadísticas del sistema de auditoría"""
-        tipos = {}
-        for evento in self.eventos:
-            tipos[evento.tipo] = tipos.get(evento.tipo, 0) + 1
+    def obtener_estadisticas(self, force=False):
+        """
+        Retorna estadísticas del sistema de auditoría
+        La integridad se recalcula solo si hubo eventos nuevos o si force=True
+        """
+        total = len(self.eventos)
+        if not self.eventos:
+            integridad = True
+        elif force or self._integrity_cache is None or self._integrity_cache[0] != total:
+            integridad = self.verificar_integridad()
+        else:
+            integridad = self._integrity_cache[1]
         
         return {
-            'total_eventos': len(self.eventos),
-            'eventos_por_tipo': tipos,
+            'total_eventos': total,
+            'eventos_por_tipo': dict(self._tipos_count),
             'hash_genesis': self.hash_genesis,
-            'integridad_verificada': self.verificar_integridad() if self.eventos else True
+            'integridad_verificada': integridad
         }
@@ -1,7 +1,10 @@
 """Utilidades criptográficas con gmpy2"""
 import hashlib
+from functools import lru_cache
 import gmpy2
 
+_MPZ = type(gmpy2.mpz(0))
+
 
 def is_prime(n, k=25):
     """Test de primalidad Miller-Rabin"""
@@ -51,31 +54,219 @@ def mod_inverse(a, m):
         raise ValueError(f"El inverso modular de {a} módulo {m} no existe")
 
 
+class FixedBaseTable:
+    """
+    Tabla de exponenciación de base fija con ventanas de w bits
+    
+    rows[i][j] = base^(j * 2^(i*w)) mod p, de modo que base^exp se obtiene
+    multiplicando una entrada por cada ventana del exponente (sin elevar al cuadrado).
+    """
+    
+    def __init__(self, base, p, bits, window=6):
+        self.base = gmpy2.mpz(base)
+        self.p = gmpy2.mpz(p)
+        self.bits = bits
+        self.window = window
+        self.mask = (1 << window) - 1
+        self.rows = []
+        
+        b = self.base % self.p
+        for _ in range((bits + window - 1) // window):
+            row = [gmpy2.mpz(1)]
+            for _ in range(self.mask):
+                row.append((row[-1] * b) % self.p)
+            self.rows.append(row)
+            b = (row[-1] * b) % self.p
+    
+    def pow(self, exp):
+        """Calcula base^exp mod p usando la tabla"""
+        if exp < 0 or exp >> self.bits:
+            # Exponente fuera del rango de la tabla
+            return gmpy2.powmod(self.base, exp, self.p)
+        
+        p, mask, window = self.p, self.mask, self.window
+        acc = gmpy2.mpz(1)
+        for row in self.rows:
+            if not exp:
+                break
+            digit = exp & mask
+            if digit:
+                acc = (acc * row[digit]) % p
+            exp >>= window
+        return acc
+
+
+def fixed_pow_pair(table_a, table_b, exp):
+    """
+    Calcula (a^exp, b^exp) con dos tablas de base fija sobre el mismo módulo
+    
+    Un solo recorrido de las ventanas del exponente sirve para ambas bases.
+    """
+    if (exp < 0 or exp >> table_a.bits or exp >> table_b.bits
+            or table_a.window != table_b.window):
+        return table_a.pow(exp), table_b.pow(exp)
+    
+    p, mask, window = table_a.p, table_a.mask, table_a.window
+    acc_a = gmpy2.mpz(1)
+    acc_b = gmpy2.mpz(1)
+    for row_a, row_b in zip(table_a.rows, table_b.rows):
+        if not exp:
+            break
+        digit = exp & mask
+        if digit:
+            acc_a = (acc_a * row_a[digit]) % p
+            acc_b = (acc_b * row_b[digit]) % p
+        exp >>= window
+    return acc_a, acc_b
+
+
+# Cada clave usa dos tablas (g y u) de hasta ~22 MB a 4096 bits: se conservan
+# solo las de las últimas claves para no retenerlas durante todo el proceso
+@lru_cache(maxsize=8)
+def fixed_base_table(base, p, bits):
+    """Retorna (construyendo una sola vez) la tabla de base fija para base mod p"""
+    return FixedBaseTable(base, p, bits)
+
+
+def batch_fixed_pow(base, exps, p, bits=None):
+    """
+    Calcula [base^e mod p for e in exps] recorriendo los exponentes en paralelo
+    
+    Las potencias base^(j * 2^(i*w)) de la tabla fija se comparten entre todo
+    el lote, así que ningún exponente paga elevaciones al cuadrado.
+    """
+    if bits is None:
+        bits = max((e.bit_length() for e in exps), default=1)
+    table = fixed_base_table(base, p, bits)
+    if any(e < 0 or e >> bits for e in exps):
+        return [table.pow(e) for e in exps]
+    
+    p, mask, window = table.p, table.mask, table.window
+    accs = [gmpy2.mpz(1)] * len(exps)
+    rest = list(exps)
+    for row in table.rows:
+        for k, e in enumerate(rest):
+            digit = e & mask
+            if digit:
+                accs[k] = (accs[k] * row[digit]) % p
+            rest[k] = e >> window
+    return accs
+
+
+def multi_exp(bases, exps, m):
+    """
+    Multi-exponenciación prod(b_i^e_i) mod m (método de Pippenger por cubetas)
+    
+    Para pocas bases es más rápido exponenciar cada una con gmpy2.powmod.
+    """
+    m = gmpy2.mpz(m)
+    n = len(bases)
+    if n < 128:
+        acc = gmpy2.mpz(1)
+        for b, e in zip(bases, exps):
+            acc = (acc * gmpy2.powmod(b, e, m)) % m
+        return acc
+    
+    c = n.bit_length() - 3  # Bits por ventana
+    mask = (1 << c) - 1
+    max_bits = max(e.bit_length() for e in exps)
+    
+    acc = gmpy2.mpz(1)
+    for shift in range(((max_bits + c - 1) // c - 1) * c, -1, -c):
+        acc = gmpy2.powmod(acc, 1 << c, m)
+        
+        # Agrupar bases por el dígito de la ventana actual
+        buckets = [None] * (mask + 1)
+        for b, e in zip(bases, exps):
+            d = (e >> shift) & mask
+            if d:
+                bucket = buckets[d]
+                buckets[d] = b if bucket is None else (bucket * b) % m
+        
+        # prod(bucket_d^d) mediante sumas acumuladas
+        running = gmpy2.mpz(1)
+        window = gmpy2.mpz(1)
+        for d in range(mask, 0, -1):
+            bucket = buckets[d]
+            if bucket is not None:
+                running = (running * bucket) % m
+            window = (window * running) % m
+        acc = (acc * window) % m
+    return acc
+
+
+@lru_cache(maxsize=256)
+def _int_to_bytes(n):
+    """Convierte entero a bytes big-endian (cacheado para p, q, g, u repetidos)"""
+    return n.to_bytes((n.bit_length() + 7) >> 3, 'big')
+
+
+def _enc(element):
+    """Serializa un elemento del hash a bytes"""
+    if isinstance(element, int):
+        return _int_to_bytes(element)
+    if isinstance(element, _MPZ):
+        return _int_to_bytes(int(element))
+    if isinstance(element, str):
+        return element.encode('utf-8')
+    if isinstance(element, bytes):
+        return element
+    return str(element).encode('utf-8')
+
+
 def hash_to_challenge(*elements):
     """Hash SHA-256 para transformación Fiat-Shamir"""
-    hasher = hashlib.sha256()
+    # Serializar todo en un solo buffer con prefijo de longitud (evita colisiones
+    # por concatenación) y alimentar SHA-256 en una sola llamada
+    buf = bytearray()
     for element in elements:
-        if isinstance(element, int):
-            hasher.update(element.to_bytes((element.bit_length() + 7) // 8, 'big'))
-        elif isinstance(element, str):
-            hasher.update(element.encode('utf-8'))
-        elif isinstance(element, bytes):
-            hasher.update(element)
-        else:
-            hasher.update(str(element).encode('utf-8'))
-    return int.from_bytes(hasher.digest(), 'big')
+        enc = _enc(element)
+        buf += len(enc).to_bytes(4, 'big')
+        buf += enc
+    return int.from_bytes(hashlib.sha256(buf).digest(), 'big')
+
+
+def hash_ints(*xs):
+    """
+    Variante de hash_to_challenge solo para enteros no negativos (int o mpz)
+    
+    Misma codificación con prefijo de longitud, sin el despacho por tipo:
+    hash_ints(*xs) == hash_to_challenge(*xs).
+    """
+    buf = bytearray()
+    for x in xs:
+        # mpz.to_bytes solo existe desde gmpy2 2.2
+        x = int(x)
+        n = (x.bit_length() + 7) >> 3
+        buf += n.to_bytes(4, 'big')
+        buf += x.to_bytes(n, 'big')
+    return int.from_bytes(hashlib.sha256(buf).digest(), 'big')
 
 
 def discrete_log_small(g, h, p, max_value):
-    """Logaritmo discreto por búsqueda exhaustiva para valores pequeños"""
+    """Logaritmo discreto por Baby-Step Giant-Step para valores pequeños"""
     g_mpz = gmpy2.mpz(g)
     h_mpz = gmpy2.mpz(h)
     p_mpz = gmpy2.mpz(p)
+    m = gmpy2.isqrt(max_value) + 1
     
+    # Pasos pequeños: g^j -> j (se conserva el menor j)
+    table = {}
     current = gmpy2.mpz(1)
-    for x in range(max_value + 1):
-        if current == h_mpz:
-            return x
+    for j in range(m):
+        table.setdefault(current, j)
         current = (current * g_mpz) % p_mpz
     
+    # Pasos gigantes: h * g^(-m*i)
+    factor = gmpy2.powmod(gmpy2.invert(g_mpz, p_mpz), m, p_mpz)
+    gamma = h_mpz
+    for i in range(m):
+        j = table.get(gamma)
+        if j is not None:
+            x = int(i * m + j)
+            if x <= max_value:
+                return x
+            break
+        gamma = (gamma * factor) % p_mpz
+    
     raise ValueError(f"No se encontró logaritmo discreto hasta {max_value}")
@@ -1,13 +1,100 @@
 """Cifrado ElGamal multiplicativo"""
 import secrets
 from collections import namedtuple
-from crypto_utils import generate_safe_prime, find_generator
+from functools import lru_cache
+import gmpy2
+from crypto_utils import generate_safe_prime, find_generator, fixed_base_table, fixed_pow_pair, mod_inverse, discrete_log_small
 
 PublicKey = namedtuple('PublicKey', ['p', 'q', 'g', 'u'])
 PrivateKey = namedtuple('PrivateKey', ['alpha'])
 Ciphertext = namedtuple('Ciphertext', ['v', 'e'])
 
 
+# Primos seguros estándar (grupos MODP de RFC 3526) con generador g = 2, que
+# pertenece al subgrupo de orden q = (p-1)/2 porque p ≡ 7 (mod 8)
+STANDARD_GROUPS = {
+    # Grupo 14 de RFC 3526 (2048 bits)
+    2048: (
+        'FFFFFFFFFFFFFFFFC90FDAA22168C234C4C6628B80DC1CD129024E088A67CC74'
+        '020BBEA63B139B22514A08798E3404DDEF9519B3CD3A431B302B0A6DF25F1437'
+        '4FE1356D6D51C245E485B576625E7EC6F44C42E9A637ED6B0BFF5CB6F406B7ED'
+        'EE386BFB5A899FA5AE9F24117C4B1FE649286651ECE45B3DC2007CB8A163BF05'
+        '98DA48361C55D39A69163FA8FD24CF5F83655D23DCA3AD961C62F356208552BB'
+        '9ED529077096966D670C354E4ABC9804F1746C08CA18217C32905E462E36CE3B'
+        'E39E772C180E86039B2783A2EC07A28FB5C55DF06F4C52C9DE2BCBF695581718'
+        '3995497CEA956AE515D2261898FA051015728E5A8AACAA68FFFFFFFFFFFFFFFF'
+    ),
+    # Grupo 15 de RFC 3526 (3072 bits)
+    3072: (
+        'FFFFFFFFFFFFFFFFC90FDAA22168C234C4C6628B80DC1CD129024E088A67CC74'
+        '020BBEA63B139B22514A08798E3404DDEF9519B3CD3A431B302B0A6DF25F1437'
+        '4FE1356D6D51C245E485B576625E7EC6F44C42E9A637ED6B0BFF5CB6F406B7ED'
+        'EE386BFB5A899FA5AE9F24117C4B1FE649286651ECE45B3DC2007CB8A163BF05'
+        '98DA48361C55D39A69163FA8FD24CF5F83655D23DCA3AD961C62F356208552BB'
+        '9ED529077096966D670C354E4ABC9804F1746C08CA18217C32905E462E36CE3B'
+        'E39E772C180E86039B2783A2EC07A28FB5C55DF06F4C52C9DE2BCBF695581718'
+        '3995497CEA956AE515D2261898FA051015728E5A8AAAC42DAD33170D04507A33'
+        'A85521ABDF1CBA64ECFB850458DBEF0A8AEA71575D060C7DB3970F85A6E1E4C7'
+        'ABF5AE8CDB0933D71E8C94E04A25619DCEE3D2261AD2EE6BF12FFA06D98A0864'
+        'D87602733EC86A64521F2B18177B200CBBE117577A615D6C770988C0BAD946E2'
+        '08E24FA074E5AB3143DB5BFCE0FD108E4B82D120A93AD2CAFFFFFFFFFFFFFFFF'
+    ),
+    # Grupo 16 de RFC 3526 (4096 bits)
+    4096: (
+        'FFFFFFFFFFFFFFFFC90FDAA22168C234C4C6628B80DC1CD129024E088A67CC74'
+        '020BBEA63B139B22514A08798E3404DDEF9519B3CD3A431B302B0A6DF25F1437'
+        '4FE1356D6D51C245E485B576625E7EC6F44C42E9A637ED6B0BFF5CB6F406B7ED'
+        'EE386BFB5A899FA5AE9F24117C4B1FE649286651ECE45B3DC2007CB8A163BF05'
+        '98DA48361C55D39A69163FA8FD24CF5F83655D23DCA3AD961C62F356208552BB'
+        '9ED529077096966D670C354E4ABC9804F1746C08CA18217C32905E462E36CE3B'
+        'E39E772C180E86039B2783A2EC07A28FB5C55DF06F4C52C9DE2BCBF695581718'
+        '3995497CEA956AE515D2261898FA051015728E5A8AAAC42DAD33170D04507A33'
+        'A85521ABDF1CBA64ECFB850458DBEF0A8AEA71575D060C7DB3970F85A6E1E4C7'
+        'ABF5AE8CDB0933D71E8C94E04A25619DCEE3D2261AD2EE6BF12FFA06D98A0864'
+        'D87602733EC86A64521F2B18177B200CBBE117577A615D6C770988C0BAD946E2'
+        '08E24FA074E5AB3143DB5BFCE0FD108E4B82D120A92108011A723C12A787E6D7'
+        '88719A10BDBA5B2699C327186AF4E23C1A946834B6150BDA2583E9CA2AD44CE8'
+        'DBBBC2DB04DE8EF92E8EFC141FBECAA6287C59474E6BC05D99B2964FA090C3A2'
+        '233BA186515BE7ED1F612970CEE2D7AFB81BDD762170481CD0069127D5B05AA9'
+        '93B4EA988D8FDDC186FFB7DC90A6C08F4DF435C934063199FFFFFFFFFFFFFFFF'
+    ),
+}
+
+
+def standard_group(bits):
+    """Retorna (p, q, g) del grupo estándar de bits dados, o None si no existe"""
+    p_hex = STANDARD_GROUPS.get(bits)
+    if p_hex is None:
+        return None
+    p = int(p_hex, 16)
+    return p, (p - 1) // 2, 2
+
+
+@lru_cache(maxsize=8)
+def public_key_mpz(public_key):
+    """Copia de la clave pública con componentes mpz para la aritmética interna"""
+    return PublicKey(*map(gmpy2.mpz, public_key))
+
+
+def fixed_base_tables(public_key):
+    """Tablas de base fija (g, u) de una clave pública, para exponentes < q"""
+    bits = public_key.q.bit_length()
+    return (fixed_base_table(public_key.g, public_key.p, bits),
+            fixed_base_table(public_key.u, public_key.p, bits))
+
+
+def encrypt_bit(message_bit, public_key):
+    """Cifra un bit con la clave pública dada, sin instancia de ElGamalSystem"""
+    pkm = public_key_mpz(public_key)
+    beta = secrets.randbelow(public_key.q - 1) + 1
+    g_table, u_table = fixed_base_tables(public_key)
+    v, u_beta = fixed_pow_pair(g_table, u_table, beta)
+    # g^m con m ∈ {0, 1} no requiere exponenciación
+    e = (u_beta * pkm.g) % pkm.p if message_bit else u_beta
+    
+    return Ciphertext(v, e), beta
+
+
 class ElGamalSystem:
     """Sistema de cifrado ElGamal multiplicativo"""
     
@@ -16,16 +103,25 @@ class ElGamalSystem:
         self.public_key = None
         self.private_key = None
     
-    def generate_keys(self):
-        """Genera par de claves pública/privada"""
+    def generate_keys(self, regenerate=False):
+        """
+        Genera par de claves pública/privada
+        Si existe un grupo estándar del tamaño pedido se usa directamente;
+        con regenerate=True se genera un primo seguro nuevo
+        """
         print("\n" + "="*70)
         print("GENERACIÓN DE PARÁMETROS DEL SISTEMA ELGAMAL")
         print("="*70)
         
-        p, q = generate_safe_prime(self.bits)
-        g = find_generator(p, q)
+        grupo = None if regenerate else standard_group(self.bits)
+        if grupo is not None:
+            p, q, g = grupo
+            print(f"Usando grupo estándar RFC 3526 de {self.bits} bits (g = {g})")
+        else:
+            p, q = generate_safe_prime(self.bits)
+            g = find_generator(p, q)
         alpha = secrets.randbelow(q - 1) + 1
-        u = pow(g, alpha, p)
+        u = int(gmpy2.powmod_sec(g, alpha, p))  # Exponente secreto: tiempo constante
         
         print(f"\nClave privada: α = {alpha}")
         print(f"Clave pública: u = g^α mod p = {u}")
@@ -33,8 +129,14 @@ class ElGamalSystem:
         
         self.public_key = PublicKey(p, q, g, u)
         self.private_key = PrivateKey(alpha)
+        self.public_key_mpz = public_key_mpz(self.public_key)
+        self._precompute_tables()
         return self.public_key, self.private_key
     
+    def _precompute_tables(self):
+        """Precalcula las tablas de exponenciación de base fija para g y u"""
+        fixed_base_tables(self.public_key)
+    
     def encrypt(self, message_bit, public_key=None):
         """Cifra un bit (0 o 1) usando ElGamal multiplicativo"""
         if message_bit not in [0, 1]:
@@ -44,13 +146,7 @@ class ElGamalSystem:
         if pk is None:
             raise ValueError("No hay clave pública disponible")
         
-        beta = secrets.randbelow(pk.q - 1) + 1
-        v = pow(pk.g, beta, pk.p)
-        u_beta = pow(pk.u, beta, pk.p)
-        g_b = pow(pk.g, message_bit, pk.p)
-        e = (u_beta * g_b) % pk.p
-        
-        return Ciphertext(v, e), beta
+        return encrypt_bit(message_bit, pk)
     
     def decrypt(self, ciphertext, private_key=None):
         """Descifra texto cifrado ElGamal, retorna g^m mod p"""
@@ -58,31 +154,29 @@ class ElGamalSystem:
         if sk is None:
             raise ValueError("No hay clave privada disponible")
         
-        pk = self.public_key
-        v_alpha = pow(ciphertext.v, sk.alpha, pk.p)
+        pkm = public_key_mpz(self.public_key)
+        v_alpha = gmpy2.powmod_sec(ciphertext.v, sk.alpha, pkm.p)  # Tiempo constante
         
-        from crypto_utils import mod_inverse
-        v_alpha_inv = mod_inverse(v_alpha, pk.p)
-        g_m = (ciphertext.e * v_alpha_inv) % pk.p
-        return g_m
+        v_alpha_inv = mod_inverse(v_alpha, pkm.p)
+        g_m = (ciphertext.e * v_alpha_inv) % pkm.p
+        return int(g_m)
     
     def homomorphic_add(self, ciphertexts):
         """Suma homomórfica multiplicando componentes de cifrados"""
         if not ciphertexts:
             raise ValueError("La lista de cifrados está vacía")
         
-        pk = self.public_key
-        v_product = 1
-        e_product = 1
+        p = public_key_mpz(self.public_key).p
+        v_product = gmpy2.mpz(1)
+        e_product = gmpy2.mpz(1)
         
-        for ct in ciphertexts:
-            v_product = (v_product * ct.v) % pk.p
-            e_product = (e_product * ct.e) % pk.p
+        for v, e in ciphertexts:
+            v_product = (v_product * v) % p
+            e_product = (e_product * e) % p
         
         return Ciphertext(v_product, e_product)
     
     def decrypt_sum(self, aggregated_ciphertext, max_sum):
-        """Descifra cifrado agregado y recupera suma por búsqueda exhaustiva"""
+        """Descifra cifrado agregado y recupera la suma con Baby-Step Giant-Step"""
         g_sum = self.decrypt(aggregated_ciphertext)
-        from crypto_utils import discrete_log_small
         return discrete_log_small(self.public_key.g, g_sum, self.public_key.p, max_sum)
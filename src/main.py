@@ -11,8 +11,10 @@ Este programa simula una elección con las siguientes características:
 - Solo se revela el conteo total, nunca los votos individuales
 """
 
+import os
 import time
-from voting_system import VotingAuthority, Voter, VotingCenter, TallyingCenter
+from concurrent.futures import ProcessPoolExecutor
+from voting_system import VotingAuthority, Voter, VotingCenter, TallyingCenter, PARALLEL_MIN_VOTES
 
 
 def print_header():
@@ -31,6 +33,29 @@ def print_header():
     print()
 
 
+def _cast_vote(job):
+    """Cifra un voto y genera su prueba NIZK (se ejecuta en un proceso del pool)"""
+    voter, vote_choice, public_key = job
+    return voter.cast_vote(vote_choice, public_key)
+
+
+def cast_votes(voters, choices, public_key):
+    """
+    Cifra los votos de varios votantes en paralelo
+    
+    Cada cifrado + prueba NIZK es independiente, así que se reparten entre
+    procesos; para pocos votos o una sola CPU el costo de crear el pool no
+    compensa.
+    """
+    jobs = [(voter, choice, public_key) for voter, choice in zip(voters, choices)]
+    workers = os.cpu_count() or 1
+    if workers == 1 or len(jobs) < PARALLEL_MIN_VOTES:
+        return [_cast_vote(job) for job in jobs]
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_cast_vote, jobs))
+
+
 def simulate_election():
     """Simula una elección completa"""
     
@@ -46,9 +71,11 @@ def simulate_election():
     
     # Crear autoridad electoral
     authority = VotingAuthority(bits=512)
+    authority.auditoria.verbose = True
     
     # Generar parámetros y claves
     public_key = authority.setup_election()
+    authority.auditoria.volcar_log()
     
     time.sleep(0.5)
     
@@ -74,6 +101,7 @@ def simulate_election():
     
     # Registrar votantes y emitir tokens
     tokens = authority.register_voters(voter_ids)
+    authority.auditoria.volcar_log()
     
     time.sleep(0.5)
     
@@ -89,7 +117,7 @@ def simulate_election():
     print()
     
     # Crear centro de votación
-    voting_center = VotingCenter(authority.token_system, public_key, authority.auditoria)
+    voting_center = VotingCenter(authority.token_system, public_key, authority.auditoria, verbose=True)
     
     # Simular votos de cada participante
     # Cada votante elige SÍ (True) o NO (False)
@@ -104,18 +132,18 @@ def simulate_election():
         ("Héctor_2024", True),   # SÍ
     ]
     
-    for voter_id, vote_choice in votes_to_cast:
+    # Cifrar todos los votos y generar sus pruebas NIZK (en paralelo)
+    print(f"→ Cifrando {len(votes_to_cast)} votos y generando pruebas NIZK...")
+    voters = [Voter(voter_id, tokens[voter_id]) for voter_id, _ in votes_to_cast]
+    encrypted_votes = cast_votes(voters, [choice for _, choice in votes_to_cast], public_key)
+    
+    # Enviar los votos en orden (la auditoría registra los eventos secuencialmente)
+    for (voter_id, vote_choice), encrypted_vote in zip(votes_to_cast, encrypted_votes):
         print(f"\n{'='*70}")
         print(f"Votante: {voter_id}")
         print(f"{'='*70}")
         
-        # Crear objeto votante
-        voter = Voter(voter_id, tokens[voter_id])
-        
-        # Cifrar voto y generar prueba NIZK
-        print(f"  → Cifrando voto (privado: {'SÍ' if vote_choice else 'NO'})...")
-        encrypted_vote = voter.cast_vote(vote_choice, public_key)
-        
+        print(f"  → Voto cifrado (privado: {'SÍ' if vote_choice else 'NO'})")
         print(f"    Voto cifrado generado:")
         print(f"      v = {encrypted_vote.ciphertext.v % 10000}... (truncado)")
         print(f"      e = {encrypted_vote.ciphertext.e % 10000}... (truncado)")
@@ -124,6 +152,7 @@ def simulate_election():
         # Enviar voto al centro de votación
         print(f"\n  → Enviando voto al centro de votación...")
         voting_center.receive_vote(encrypted_vote)
+        authority.auditoria.volcar_log()
         
         time.sleep(0.3)
     
@@ -162,17 +191,19 @@ def simulate_election():
     print("▓"*70)
     
     # Crear centro de recuento
-    tallying_center = TallyingCenter(authority.elgamal, authority.auditoria, public_key)
+    tallying_center = TallyingCenter(authority.elgamal, authority.auditoria, public_key, verbose=True)
     
-    # Obtener votos válidos
+    # Obtener votos válidos y sus pruebas NIZK
     valid_votes = voting_center.get_valid_votes()
+    valid_proofs = voting_center.get_valid_proofs()
     
-    # Realizar recuento homomórfico (con mixnet)
-    yes_count, no_count = tallying_center.tally_votes(valid_votes)
+    # Realizar recuento homomórfico (verificación en lote + mixnet)
+    yes_count, no_count = tallying_center.tally_votes(valid_votes, valid_proofs)
     
     # Publicar resultados
     stats = voting_center.get_statistics()
     tallying_center.publish_results(yes_count, no_count, stats)
+    authority.auditoria.volcar_log()
     
     # =========================================================================
     # FASE 6: AUDITORÍA
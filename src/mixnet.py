@@ -1,17 +1,23 @@
 """Sistema de mezcla de votos (Mixnet) para romper trazabilidad"""
+import hashlib
 import secrets
-import random
 from collections import namedtuple
 from elgamal import Ciphertext, PublicKey
-from crypto_utils import hash_to_challenge
+from crypto_utils import batch_fixed_pow
 
 MixProof = namedtuple('MixProof', ['permutation_commitment', 'reencryption_proof'])
 
 class Mixnet:
     """Mezcla y re-cifra votos para romper el vínculo votante-voto"""
     
-    def __init__(self, public_key):
+    def __init__(self, public_key, verbose=False):
         self.public_key = public_key
+        self.verbose = verbose
+    
+    def _log(self, *args):
+        """Imprime solo en modo verbose"""
+        if self.verbose:
+            print(*args)
     
     def shuffle_and_recrypt(self, ciphertexts):
         """
@@ -22,30 +28,29 @@ class Mixnet:
             return [], None
         
         n = len(ciphertexts)
-        print(f"\n→ Mezclando {n} votos...")
+        self._log(f"\n→ Mezclando {n} votos...")
         
-        # 1. Generar permutación aleatoria
+        # 1. Generar permutación aleatoria (Fisher-Yates con fuente criptográfica)
         indices = list(range(n))
-        random.shuffle(indices)
-        print(f"  Permutación generada (oculta)")
+        for i in range(n - 1, 0, -1):
+            j = secrets.randbelow(i + 1)
+            indices[i], indices[j] = indices[j], indices[i]
+        self._log(f"  Permutación generada (oculta)")
         
-        # 2. Re-cifrar cada voto en el nuevo orden
-        mixed_votes = []
-        randomness_used = []
+        # 2. Re-cifrar cada voto en el nuevo orden: (v', e') = (v·g^r, e·u^r) mod p
+        pk = self.public_key
+        p = pk.p
+        bits = pk.q.bit_length()
+        randomness_used = [secrets.randbelow(pk.q - 1) + 1 for _ in range(n)]
+        g_r = batch_fixed_pow(pk.g, randomness_used, p, bits)
+        u_r = batch_fixed_pow(pk.u, randomness_used, p, bits)
         
+        mixed_votes = [None] * n
         for i, original_idx in enumerate(indices):
-            original_vote = ciphertexts[original_idx]
-            
-            # Re-cifrar: (v', e') = (v·g^r, e·u^r) mod p
-            r = secrets.randbelow(self.public_key.q - 1) + 1
-            randomness_used.append(r)
-            
-            v_new = (original_vote.v * pow(self.public_key.g, r, self.public_key.p)) % self.public_key.p
-            e_new = (original_vote.e * pow(self.public_key.u, r, self.public_key.p)) % self.public_key.p
-            
-            mixed_votes.append(Ciphertext(v_new, e_new))
+            v, e = ciphertexts[original_idx]
+            mixed_votes[i] = Ciphertext((v * g_r[i]) % p, (e * u_r[i]) % p)
         
-        print(f"  ✓ {n} votos re-cifrados y mezclados")
+        self._log(f"  ✓ {n} votos re-cifrados y mezclados")
         
         # 3. Generar prueba de mezcla correcta
         proof = self._generate_mix_proof(ciphertexts, mixed_votes, indices, randomness_used)
@@ -57,16 +62,15 @@ class Mixnet:
         Genera prueba ZKP de que la mezcla es correcta
         Demuestra que mixed es una permutación re-cifrada de original
         """
-        # Commitment de la permutación (hash de los índices + randomness)
-        perm_str = ''.join(map(str, permutation))
-        rand_str = ''.join(map(str, randomness[:3]))  # Solo primeros 3 para commitment
-        
-        commitment = hash_to_challenge(
-            perm_str,
-            rand_str,
-            len(original),
-            len(mixed)
-        )
+        # Commitment de la permutación: nonce de ocultamiento, tamaños e índices
+        # (4 bytes cada uno) alimentados directamente al hash. Sin el nonce, con
+        # n pequeño bastaría probar las n! permutaciones para revertir la mezcla;
+        # el nonce y la aleatoriedad de re-cifrado son secretos y no se publican.
+        h = hashlib.sha256(secrets.token_bytes(32))
+        h.update(len(original).to_bytes(4, 'big'))
+        h.update(len(mixed).to_bytes(4, 'big'))
+        h.update(b''.join(idx.to_bytes(4, 'big') for idx in permutation))
+        commitment = int.from_bytes(h.digest(), 'big')
         
         # Prueba simplificada: verificar que ambas listas tienen el mismo tamaño
         # En implementación real: usar protocolo más robusto (Sigma protocol extendido)
@@ -84,29 +88,29 @@ class Mixnet:
         Comprueba: mismo número de votos, formato válido, prueba válida
         """
         if not proof:
-            print("  ✗ No hay prueba de mezcla")
+            self._log("  ✗ No hay prueba de mezcla")
             return False
         
         # Verificar tamaños
         if len(original_votes) != len(mixed_votes):
-            print("  ✗ Número de votos no coincide")
+            self._log("  ✗ Número de votos no coincide")
             return False
         
         if proof.reencryption_proof['original_count'] != len(original_votes):
-            print("  ✗ Prueba no corresponde al número de votos")
+            self._log("  ✗ Prueba no corresponde al número de votos")
             return False
         
         # Verificar formato de votos mezclados
         for vote in mixed_votes:
             if not isinstance(vote, Ciphertext):
-                print("  ✗ Formato de voto inválido")
+                self._log("  ✗ Formato de voto inválido")
                 return False
             
             if vote.v <= 0 or vote.e <= 0:
-                print("  ✗ Componentes de voto inválidos")
+                self._log("  ✗ Componentes de voto inválidos")
                 return False
         
-        print("  ✓ Mezcla verificada correctamente")
+        self._log("  ✓ Mezcla verificada correctamente")
         return True
     
     def get_statistics(self, original_votes, mixed_votes):
@@ -6,13 +6,33 @@ Este módulo implementa el protocolo Chaum-Pedersen disjuntivo que permite proba
 que un cifrado ElGamal contiene g^0 o g^1 sin revelar cuál. El protocolo es
 convertido de interactivo a no-interactivo mediante la transformación Fiat-Shamir.
 """
+import os
 import secrets
 from collections import namedtuple
-from elgamal import PublicKey, Ciphertext
-from crypto_utils import hash_to_challenge, mod_inverse
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import gmpy2
+from elgamal import PublicKey, Ciphertext, fixed_base_tables, public_key_mpz
+from crypto_utils import hash_ints, multi_exp, fixed_pow_pair
 
 NIZKProof = namedtuple('NIZKProof', ['a1_v', 'a1_e', 'a2_v', 'a2_e', 'z1', 'z2', 'c1', 'c2'])
 
+# Por debajo de este número de pruebas, crear el pool de procesos (~20 ms)
+# cuesta más que verificar el lote completo en el proceso actual
+PARALLEL_MIN_PROOFS = 256
+
+
+def _check_batch_chunk(job):
+    """Verifica en lote un tramo de pruebas (se ejecuta en un proceso del pool)"""
+    ciphertexts, proofs, public_key = job
+    return NIZKSystem.check_batch(ciphertexts, proofs, PublicKey(*public_key))
+
+
+@lru_cache(maxsize=8)
+def _g_inverse(g, p):
+    """Inverso de g módulo p, calculado una sola vez por clave pública"""
+    return gmpy2.invert(g, p)
+
 
 class NIZKSystem:
     """
@@ -39,66 +59,74 @@ class NIZKSystem:
         Returns:
             NIZKProof con commitments, responses y challenges de ambas ramas
         """
-        p, q, g, u = public_key.p, public_key.q, public_key.g, public_key.u
-        v, e = ciphertext.v, ciphertext.e
+        # Toda la aritmética de la prueba en mpz (GMP); los elementos se
+        # convierten una sola vez al entrar
+        p, q, g, u = public_key_mpz(public_key)
+        v, e = map(gmpy2.mpz, ciphertext)
+        randomness = gmpy2.mpz(randomness)
+        tables = fixed_base_tables(public_key)
         
         if vote_bit == 0:
-            return NIZKSystem._generate_proof_for_zero(v, e, randomness, p, q, g, u)
+            return NIZKSystem._generate_proof_for_zero(v, e, randomness, p, q, g, u, tables)
         else:
-            return NIZKSystem._generate_proof_for_one(v, e, randomness, p, q, g, u)
+            return NIZKSystem._generate_proof_for_one(v, e, randomness, p, q, g, u, tables)
     
     @staticmethod
-    def _generate_proof_for_zero(v, e, beta, p, q, g, u):
+    def _generate_proof_for_zero(v, e, beta, p, q, g, u, tables):
         """
         Chaum-Pedersen disjuntivo para voto b=0
         Rama 1 (b=0): REAL - genera commitments honestamente
         Rama 2 (b=1): SIMULADA - construida hacia atrás
         """
+        g_table, u_table = tables
+        
         # RAMA 1 (REAL): Commitments honestos para b=0
         w1 = secrets.randbelow(q - 1) + 1  # Aleatoriedad fresca
-        a1_v = pow(g, w1, p)  # Commitment: g^w1
-        a1_e = pow(u, w1, p)  # Commitment: u^w1
+        a1_v, a1_e = fixed_pow_pair(g_table, u_table, w1)  # Commitments: g^w1, u^w1
         
         # RAMA 2 (SIMULADA): Simular rama b=1 hacia atrás
         c2 = secrets.randbelow(q - 1) + 1  # Challenge simulado
         z2 = secrets.randbelow(q - 1) + 1  # Response simulado
         # Calcular commitments usando ecuaciones de verificación invertidas
-        v_c2_inv = mod_inverse(pow(v, c2, p), p)
-        a2_v = (pow(g, z2, p) * v_c2_inv) % p
-        e_div_g = (e * mod_inverse(g, p)) % p
-        e_div_g_c2_inv = mod_inverse(pow(e_div_g, c2, p), p)
-        a2_e = (pow(u, z2, p) * e_div_g_c2_inv) % p
+        g_z2, u_z2 = fixed_pow_pair(g_table, u_table, z2)
+        v_c2_inv = gmpy2.powmod(v, -c2, p)
+        a2_v = (g_z2 * v_c2_inv) % p
+        e_div_g = (e * _g_inverse(g, p)) % p
+        e_div_g_c2_inv = gmpy2.powmod(e_div_g, -c2, p)
+        a2_e = (u_z2 * e_div_g_c2_inv) % p
         
         # FIAT-SHAMIR: Challenge global mediante hash
-        c = hash_to_challenge(p, q, g, u, v, e, a1_v, a1_e, a2_v, a2_e) % q
+        c = hash_ints(p, q, g, u, v, e, a1_v, a1_e, a2_v, a2_e) % q
         c1 = (c - c2) % q  # Challenge de rama real
         z1 = (w1 + c1 * beta) % q  # Response de rama real
         
         return NIZKProof(a1_v, a1_e, a2_v, a2_e, z1, z2, c1, c2)
     
     @staticmethod
-    def _generate_proof_for_one(v, e, beta, p, q, g, u):
+    def _generate_proof_for_one(v, e, beta, p, q, g, u, tables):
         """
         Chaum-Pedersen disjuntivo para voto b=1
         Rama 1 (b=0): SIMULADA - construida hacia atrás
         Rama 2 (b=1): REAL - genera commitments honestamente
         """
+        g_table, u_table = tables
+        
         # RAMA 1 (SIMULADA): Simular rama b=0 hacia atrás
         c1 = secrets.randbelow(q - 1) + 1  # Challenge simulado
         z1 = secrets.randbelow(q - 1) + 1  # Response simulado
         # Calcular commitments usando ecuaciones de verificación invertidas
-        v_c1_inv = mod_inverse(pow(v, c1, p), p)
-        a1_v = (pow(g, z1, p) * v_c1_inv) % p
-        e_c1_inv = mod_inverse(pow(e, c1, p), p)
-        a1_e = (pow(u, z1, p) * e_c1_inv) % p
+        g_z1, u_z1 = fixed_pow_pair(g_table, u_table, z1)
+        v_c1_inv = gmpy2.powmod(v, -c1, p)
+        a1_v = (g_z1 * v_c1_inv) % p
+        e_c1_inv = gmpy2.powmod(e, -c1, p)
+        a1_e = (u_z1 * e_c1_inv) % p
         
         # RAMA 2 (REAL): Commitments honestos para b=1
         w2 = secrets.randbelow(q - 1) + 1  # Aleatoriedad fresca
-        a2_v = pow(g, w2, p)  # Commitment: g^w2
-        a2_e = pow(u, w2, p)  # Commitment: u^w2
+        a2_v, a2_e = fixed_pow_pair(g_table, u_table, w2)  # Commitments: g^w2, u^w2
         
         # FIAT-SHAMIR: Challenge global mediante hash
-        c = hash_to_challenge(p, q, g, u, v, e, a1_v, a1_e, a2_v, a2_e) % q
+        c = hash_ints(p, q, g, u, v, e, a1_v, a1_e, a2_v, a2_e) % q
         c2 = (c - c1) % q  # Challenge de rama real
         z2 = (w2 + c2 * beta) % q  # Response de rama real
         
@@ -120,35 +148,200 @@ class NIZKSystem:
         Returns:
             True si la prueba es válida, False en caso contrario
         """
-        p, q, g, u = public_key.p, public_key.q, public_key.g, public_key.u
-        v, e = ciphertext.v, ciphertext.e
+        return NIZKSystem.check_proof(ciphertext, proof, public_key)[0]
+    
+    @staticmethod
+    def check_proof(ciphertext, proof, public_key):
+        """
+        Verifica una prueba NIZK e informa el motivo del rechazo
+        
+        Returns:
+            Tupla (es_valida, motivo); si la prueba es inválida, el motivo
+            indica qué comprobación o ecuación falló
+        """
+        p, q, g, u = public_key_mpz(public_key)
+        v, e = map(gmpy2.mpz, ciphertext)
+        a1_v, a1_e, a2_v, a2_e, z1, z2, c1, c2 = proof
+        
+        # Todos los elementos deben estar en el subgrupo de orden q (residuos
+        # cuadráticos): los exponentes se reducen módulo q
+        for x in (v, e, a1_v, a1_e, a2_v, a2_e):
+            if not 0 < x < p or gmpy2.jacobi(x, p) != 1:
+                return False, "elemento fuera del subgrupo"
         
         # FIAT-SHAMIR: Recalcular challenge global
-        c = hash_to_challenge(p, q, g, u, v, e, proof.a1_v, proof.a1_e, proof.a2_v, proof.a2_e) % q
+        c = hash_ints(p, q, g, u, v, e, a1_v, a1_e, a2_v, a2_e) % q
         
         # Verificar que challenges suman al challenge global
-        if (proof.c1 + proof.c2) % q != c:
-            print("  ✗ Verificación falló: c1 + c2 ≠ c")
-            return False
+        if (c1 + c2) % q != c:
+            return False, "c1 + c2 ≠ c"
+        
+        g_table, u_table = fixed_base_tables(public_key)
+        
+        # Ruta rápida: las cuatro ecuaciones combinadas en una sola. Si falla, se
+        # revisan una por una para informar cuál de ellas no se cumple
+        if NIZKSystem._verify_combined(v, e, proof, p, q, g_table, u_table):
+            return True, "Prueba válida"
         
         # CHAUM-PEDERSEN: Verificar ecuaciones de rama 1 (b=0)
         # g^z1 = a1_v * v^c1 y u^z1 = a1_e * e^c1
-        if pow(g, proof.z1, p) != (proof.a1_v * pow(v, proof.c1, p)) % p:
-            print("  ✗ Verificación falló en rama 1 (v)")
-            return False
-        if pow(u, proof.z1, p) != (proof.a1_e * pow(e, proof.c1, p)) % p:
-            print("  ✗ Verificación falló en rama 1 (e)")
-            return False
+        g_z1, u_z1 = fixed_pow_pair(g_table, u_table, z1)
+        if g_z1 != (a1_v * gmpy2.powmod(v, c1, p)) % p:
+            return False, "falló la rama 1 (v)"
+        if u_z1 != (a1_e * gmpy2.powmod(e, c1, p)) % p:
+            return False, "falló la rama 1 (e)"
         
         # CHAUM-PEDERSEN: Verificar ecuaciones de rama 2 (b=1)
         # g^z2 = a2_v * v^c2 y u^z2 = a2_e * (e/g)^c2
-        if pow(g, proof.z2, p) != (proof.a2_v * pow(v, proof.c2, p)) % p:
-            print("  ✗ Verificación falló en rama 2 (v)")
-            return False
+        g_z2, u_z2 = fixed_pow_pair(g_table, u_table, z2)
+        if g_z2 != (a2_v * gmpy2.powmod(v, c2, p)) % p:
+            return False, "falló la rama 2 (v)"
+        
+        e_div_g = (e * _g_inverse(g, p)) % p
+        if u_z2 != (a2_e * gmpy2.powmod(e_div_g, c2, p)) % p:
+            return False, "falló la rama 2 (e/g)"
+        
+        return True, "Prueba válida"
+    
+    @staticmethod
+    def _verify_combined(v, e, proof, p, q, g_table, u_table):
+        """
+        Verifica las cuatro ecuaciones Chaum-Pedersen de una prueba a la vez
+        
+        Cada ecuación se eleva a un escalar aleatorio de 80 bits y se multiplican:
+        g^(r1·z1 + r3·z2 + r4·c2) · u^(r2·z1 + r4·z2) =
+            a1_v^r1 · a1_e^r2 · a2_v^r3 · a2_e^r4 · v^(r1·c1 + r3·c2) · e^(r2·c1 + r4·c2)
+        Solo dos exponenciaciones de base variable con exponentes completos, y
+        el factor g^c2 de la rama 2 entra en el exponente de g (sin inverso de g).
+        Supone que check_proof ya comprobó que los elementos están en el subgrupo.
+        """
+        a1_v, a1_e, a2_v, a2_e, z1, z2, c1, c2 = proof
+        elements = (v, e, a1_v, a1_e, a2_v, a2_e)
+        
+        r1, r2, r3, r4 = (secrets.randbits(80) for _ in range(4))
+        lhs = (g_table.pow((r1 * z1 + r3 * z2 + r4 * c2) % q) *
+               u_table.pow((r2 * z1 + r4 * z2) % q)) % p
+        rhs = multi_exp(elements, ((r1 * c1 + r3 * c2) % q, (r2 * c1 + r4 * c2) % q,
+                                   r1, r2, r3, r4), p)
+        return lhs == rhs
+    
+    @staticmethod
+    def check_batch(ciphertexts, proofs, public_key):
+        """
+        Verifica un lote de pruebas NIZK con una combinación lineal aleatoria
+        
+        Las cuatro ecuaciones de cada prueba se elevan a escalares aleatorios
+        ρ de 80 bits y se multiplican en una sola ecuación, evaluada con una
+        multi-exponenciación. Si alguna prueba es inválida, el lote es rechazado
+        con probabilidad >= 1 - 2^-80.
         
-        e_div_g = (e * mod_inverse(g, p)) % p
-        if pow(u, proof.z2, p) != (proof.a2_e * pow(e_div_g, proof.c2, p)) % p:
-            print("  ✗ Verificación falló en rama 2 (e/g)")
-            return False
+        Args:
+            ciphertexts: Lista de cifrados ElGamal (v, e)
+            proofs: Lista de NIZKProof, en el mismo orden que los cifrados
+            public_key: Clave pública del sistema
+            
+        Returns:
+            Tupla (lote_valido, motivo); si el lote es inválido, el motivo
+            indica qué comprobación o ecuación falló
+        """
+        if len(ciphertexts) != len(proofs):
+            return False, "número de cifrados y pruebas no coincide"
+        if not proofs:
+            return True, "Lote vacío"
+        
+        p, q, g, u = public_key_mpz(public_key)
+        g_table, u_table = fixed_base_tables(public_key)
+        
+        exp_g = 0
+        exp_u = 0
+        bases = []
+        exps = []
+        
+        # Funciones del bucle en variables locales (evita búsquedas globales por prueba)
+        jacobi = gmpy2.jacobi
+        randbits = secrets.randbits
+        add_bases = bases.extend
+        add_exps = exps.extend
+        
+        for (v, e), (a1_v, a1_e, a2_v, a2_e, z1, z2, c1, c2) in zip(ciphertexts, proofs):
+            elements = (v, e, a1_v, a1_e, a2_v, a2_e)
+            
+            # Todos los elementos deben estar en el subgrupo de orden q (residuos
+            # cuadráticos), para que los exponentes puedan reducirse módulo q
+            for x in elements:
+                if not 0 < x < p or jacobi(x, p) != 1:
+                    return False, "elemento fuera del subgrupo"
+            
+            # FIAT-SHAMIR: el challenge se comprueba individualmente (es barato)
+            c = hash_ints(p, q, g, u, *elements) % q
+            if (c1 + c2) % q != c:
+                return False, "c1 + c2 ≠ c"
+            
+            # g^z1 = a1_v v^c1, u^z1 = a1_e e^c1, g^z2 = a2_v v^c2, u^z2 g^c2 = a2_e e^c2
+            r1, r2, r3, r4 = randbits(80), randbits(80), randbits(80), randbits(80)
+            exp_g += r1 * z1 + r3 * z2 + r4 * c2
+            exp_u += r2 * z1 + r4 * z2
+            add_bases(elements)
+            add_exps((
+                (r1 * c1 + r3 * c2) % q,
+                (r2 * c1 + r4 * c2) % q,
+                r1, r2, r3, r4
+            ))
+        
+        lhs = (g_table.pow(exp_g % q) * u_table.pow(exp_u % q)) % p
+        if lhs != multi_exp(bases, exps, p):
+            return False, "la ecuación combinada no se cumple"
+        
+        return True, "Lote válido"
+    
+    @staticmethod
+    def find_invalid_proofs(ciphertexts, proofs, public_key):
+        """
+        Localiza las pruebas inválidas de un lote rechazado por bisección
+        
+        Cada mitad se verifica en lote y solo se subdividen las que fallan,
+        así que con k pruebas inválidas entre N basta con O(k log N) lotes.
+        
+        Returns:
+            Lista ordenada de índices de las pruebas inválidas
+        """
+        invalid = []
+        pending = [(0, len(proofs))]
+        while pending:
+            start, end = pending.pop()
+            if NIZKSystem.check_batch(ciphertexts[start:end], proofs[start:end], public_key)[0]:
+                continue
+            if end - start == 1:
+                invalid.append(start)
+                continue
+            middle = (start + end) // 2
+            pending.append((middle, end))
+            pending.append((start, middle))
+        return sorted(invalid)
+    
+    @staticmethod
+    def parallel_check_batch(ciphertexts, proofs, public_key, workers=None):
+        """
+        Verifica un lote de pruebas NIZK repartiéndolo entre procesos
+        
+        Cada proceso verifica en lote un tramo contiguo; el resultado es válido
+        solo si todos los tramos lo son. Para lotes pequeños o una sola CPU se
+        verifica el lote completo en el proceso actual.
+        
+        Returns:
+            Tupla (lote_valido, motivo); si el lote es inválido, el motivo
+            es el del primer tramo que falló
+        """
+        workers = workers or os.cpu_count() or 1
+        if len(ciphertexts) != len(proofs) or workers == 1 or len(proofs) < PARALLEL_MIN_PROOFS:
+            return NIZKSystem.check_batch(ciphertexts, proofs, public_key)
         
-        return True
+        size = -(-len(proofs) // workers)
+        key = tuple(public_key)
+        jobs = [(ciphertexts[i:i + size], proofs[i:i + size], key)
+                for i in range(0, len(proofs), size)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for valid, reason in executor.map(_check_batch_chunk, jobs):
+                if not valid:
+                    return False, reason
+        return True, "Lote válido"
@@ -1,10 +1,15 @@
 """Sistema de tokens para prevenir votación doble"""
+import hmac
 import secrets
 import hashlib
 from collections import namedtuple
 from datetime import datetime
 
 VoterToken = namedtuple('VoterToken', ['voter_id', 'token', 'issued_at'])
+VoterState = namedtuple('VoterState', ['token', 'issued_at', 'used'])
+
+# Mensaje de verify_token para un token ya usado (voto doble)
+TOKEN_USED = "Token ya utilizado (voto doble detectado)"
 
 
 class TokenSystem:
@@ -12,59 +17,89 @@ class TokenSystem:
     
     def __init__(self, secret_key=None):
         self.secret_key = secret_key or secrets.token_bytes(32)
-        self.issued_tokens = {}
-        self.used_tokens = set()
-        self.voter_has_voted = set()
+        # Un único registro por votante: voter_id -> VoterState
+        self.voters = {}
+        self.voted_count = 0
     
     def issue_token(self, voter_id):
         """Emite token único para votante usando HMAC-SHA256"""
-        if voter_id in self.issued_tokens:
+        if voter_id in self.voters:
             raise ValueError(f"El votante {voter_id} ya tiene un token emitido")
         
-        timestamp = datetime.now().isoformat()
-        nonce = secrets.token_hex(16)
-        message = f"{voter_id}||{timestamp}||{nonce}".encode('utf-8')
-        hmac = hashlib.sha256(self.secret_key + message).hexdigest()
-        token = f"{voter_id}:{hmac}"
+        # HMAC(clave, voter_id || nonce); la fecha de emisión se guarda
+        # aparte para auditoría y no forma parte del mensaje autenticado
+        nonce = secrets.token_bytes(16)
+        mac = hmac.new(self.secret_key, voter_id.encode('utf-8') + nonce, hashlib.sha256).hexdigest()
+        token = f"{voter_id}:{mac}"
         
-        voter_token = VoterToken(voter_id, token, timestamp)
-        self.issued_tokens[voter_id] = voter_token
+        voter_token = VoterToken(voter_id, token, datetime.now().isoformat())
+        self.voters[voter_id] = VoterState(token, voter_token.issued_at, False)
         return voter_token
     
+    def issue_tokens_bulk(self, voter_ids):
+        """
+        Emite tokens para varios votantes de una vez
+        Se valida todo el lote antes de emitir: si algún votante ya tiene token
+        o está repetido, no se emite ninguno. Retorna dict voter_id -> VoterToken
+        """
+        voter_ids = list(voter_ids)
+        if len(set(voter_ids)) != len(voter_ids):
+            raise ValueError("Hay votantes repetidos en el lote")
+        for voter_id in voter_ids:
+            if voter_id in self.voters:
+                raise ValueError(f"El votante {voter_id} ya tiene un token emitido")
+        
+        # Una sola lectura del CSPRNG y del reloj para todo el lote; el estado
+        # HMAC con la clave ya procesada se copia para cada votante
+        nonces = secrets.token_bytes(16 * len(voter_ids))
+        issued_at = datetime.now().isoformat()
+        base = hmac.new(self.secret_key, digestmod=hashlib.sha256)
+        
+        tokens = {}
+        for i, voter_id in enumerate(voter_ids):
+            mac = base.copy()
+            mac.update(voter_id.encode('utf-8') + nonces[16 * i:16 * i + 16])
+            token = f"{voter_id}:{mac.hexdigest()}"
+            tokens[voter_id] = VoterToken(voter_id, token, issued_at)
+            self.voters[voter_id] = VoterState(token, issued_at, False)
+        return tokens
+    
     def verify_token(self, token):
         """Verifica si token es válido y no ha sido usado"""
         try:
-            voter_id = token.split(':')[0]
-        except:
+            voter_id, sep, _ = token.partition(':')
+        except AttributeError:
+            return False, "Token malformado"
+        if not sep:
             return False, "Token malformado"
         
-        if voter_id not in self.issued_tokens:
+        state = self.voters.get(voter_id)
+        if state is None:
             return False, f"Token no emitido para votante {voter_id}"
         
-        if self.issued_tokens[voter_id].token != token:
+        if not hmac.compare_digest(state.token.encode(), token.encode()):  # Comparación en tiempo constante
             return False, "Token no coincide con el emitido"
         
-        if token in self.used_tokens:
-            return False, "Token ya utilizado (voto doble detectado)"
-        
-        if voter_id in self.voter_has_voted:
-            return False, f"Votante {voter_id} ya emitió su voto"
+        if state.used:
+            return False, TOKEN_USED
         
         return True, "Token válido"
     
     def mark_token_used(self, token):
         """Marca token como usado después de votar"""
-        voter_id = token.split(':')[0]
-        self.used_tokens.add(token)
-        self.voter_has_voted.add(voter_id)
+        voter_id = token.partition(':')[0]
+        state = self.voters.get(voter_id)
+        if state is not None and hmac.compare_digest(state.token.encode(), token.encode()) and not state.used:
+            self.voters[voter_id] = state._replace(used=True)
+            self.voted_count += 1
     
     def get_voter_count(self):
         """Retorna número total de votantes registrados"""
-        return len(self.issued_tokens)
+        return len(self.voters)
     
     def get_voted_count(self):
         """Retorna número de votantes que ya votaron"""
-        return len(self.voter_has_voted)
+        return self.voted_count
     
     def get_remaining_voters(self) -> int:
         """Retorna el número de votantes que aún no han votado"""
@@ -7,14 +7,12 @@ Interfaz fácil de usar para usuarios finales
 
 import os
 import sys
-import time
-from datetime import datetime
+from itertools import islice
 from voting_system import VotingAuthority, Voter, VotingCenter, TallyingCenter
 
 if sys.platform == "win32":
-    import codecs
-    sys.stdout = codecs.getwriter("utf-8")(sys.stdout.detach())
-    sys.stderr = codecs.getwriter("utf-8")(sys.stderr.detach())
+    sys.stdout.reconfigure(encoding="utf-8")
+    sys.stderr.reconfigure(encoding="utf-8")
 
 
 def limpiar_pantalla():
@@ -200,6 +198,7 @@ class AplicacionVotacion:
         print("\n   Ejemplo: votante_001, Juan_Perez, etc.\n")
         
         voter_ids = []
+        vistos = set()
         contador = 1
         
         while True:
@@ -211,10 +210,11 @@ class AplicacionVotacion:
                     continue
                 break
             
-            if voter_id in voter_ids:
+            if voter_id in vistos:
                 print(f"  El votante '{voter_id}' ya fue registrado.")
                 continue
             
+            vistos.add(voter_id)
             voter_ids.append(voter_id)
             contador += 1
         
@@ -228,7 +228,8 @@ class AplicacionVotacion:
             self.voting_center = VotingCenter(
                 self.authority.token_system,
                 self.public_key,
-                self.authority.auditoria
+                self.authority.auditoria,
+                verbose=True
             )
             
             print(f"\n✅ ¡{len(voter_ids)} votantes registrados exitosamente!")
@@ -257,22 +258,25 @@ class AplicacionVotacion:
     
     def guardar_tokens(self):
         """Guarda los tokens en un archivo"""
+        from datetime import datetime
+        
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         nombre_archivo = f"tokens_votacion_{timestamp}.txt"
         
         try:
-            with open(nombre_archivo, 'w', encoding='utf-8') as f:
-                f.write("="*70 + "\n")
-                f.write("           TOKENS DE VOTACIÓN - CONFIDENCIAL\n")
-                f.write("="*70 + "\n\n")
-                f.write(f"Elección: {self.pregunta_votacion}\n")
-                f.write(f"Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"Total votantes: {len(self.tokens)}\n\n")
-                f.write("="*70 + "\n\n")
-                
-                for voter_id, token in self.tokens.items():
-                    f.write(f"Votante: {voter_id}\n")
-                    f.write(f"Token: {token.token}\n\n")
+            with open(nombre_archivo, 'w', encoding='utf-8', buffering=1 << 20) as f:
+                separador = "="*70 + "\n"
+                f.writelines([
+                    separador,
+                    "           TOKENS DE VOTACIÓN - CONFIDENCIAL\n",
+                    separador + "\n",
+                    f"Elección: {self.pregunta_votacion}\n",
+                    f"Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n",
+                    f"Total votantes: {len(self.tokens)}\n\n",
+                    separador + "\n",
+                ])
+                f.writelines(f"Votante: {voter_id}\nToken: {token.token}\n\n"
+                             for voter_id, token in self.tokens.items())
             
             ruta_completa = os.path.abspath(nombre_archivo)
             print(f"Tokens guardados en: {ruta_completa}")
@@ -439,7 +443,8 @@ class AplicacionVotacion:
             self.tallying_center = TallyingCenter(
                 self.authority.elgamal,
                 self.authority.auditoria,
-                self.public_key
+                self.public_key,
+                verbose=True
             )
             
             # Obtener votos válidos
@@ -453,8 +458,11 @@ class AplicacionVotacion:
             print(f"Iniciando proceso de conteo...")
             print(f"   Total de votos a procesar: {len(valid_votes)}")
             
-            # Realizar recuento homomórfico con mixnet
-            yes_count, no_count = self.tallying_center.tally_votes(valid_votes)
+            # Realizar recuento homomórfico (verificación en lote + mixnet)
+            yes_count, no_count = self.tallying_center.tally_votes(
+                valid_votes,
+                self.voting_center.get_valid_proofs()
+            )
             
             # Guardar resultados
             self.resultados = {
@@ -566,11 +574,11 @@ class AplicacionVotacion:
             # Mostrar votantes registrados
             if len(self.tokens) > 0:
                 print(f"\n👥 Votantes registrados:")
-                for i, voter_id in enumerate(list(self.tokens.keys())[:10], 1):
-                    # Verificar si ya votó
-                    token = self.tokens[voter_id].token
-                    ha_votado = not self.authority.token_system.verify_token(token)[0] or \
-                               self.authority.token_system.verify_token(token)[1] == "Token ya fue usado"
+                votantes = self.authority.token_system.voters
+                for i, voter_id in enumerate(islice(self.tokens, 10), 1):
+                    # Verificar si ya votó (consulta directa del estado, sin re-verificar el token)
+                    estado_votante = votantes.get(voter_id)
+                    ha_votado = estado_votante is not None and estado_votante.used
                     
                     estado = "✓ Votó" if ha_votado else "✗ Pendiente"
                     print(f"   {i:2d}. {voter_id:<30} {estado}")
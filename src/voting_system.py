@@ -1,14 +1,39 @@
 """Sistema de votación electrónica con ElGamal"""
+import os
 import secrets
-from collections import namedtuple
-from elgamal import ElGamalSystem, PublicKey, Ciphertext
+from collections import namedtuple, Counter
+from concurrent.futures import ProcessPoolExecutor
+from enum import IntEnum
+import gmpy2
+from elgamal import ElGamalSystem, PublicKey, Ciphertext, encrypt_bit
 from nizk import NIZKSystem, NIZKProof
-from token_system import TokenSystem, VoterToken
+from token_system import TokenSystem, VoterToken, TOKEN_USED
 from mixnet import Mixnet
 from auditoria import SistemaAuditoria
 
 EncryptedVote = namedtuple('EncryptedVote', ['voter_id', 'token', 'ciphertext', 'proof'])
 
+# Motivos de rechazo de un voto; el detalle del fallo se guarda aparte
+RejectReason = IntEnum('RejectReason', 'TOKEN_INVALID DUPLICATE NIZK_INVALID')
+
+# Mínimo de votos para verificar sus pruebas en un pool de procesos
+PARALLEL_MIN_VOTES = 64
+
+# Clave pública de cada proceso del pool, fijada por _init_worker
+_worker_public_key = None
+
+
+def _init_worker(public_key):
+    """Guarda la clave pública en el proceso para no enviarla con cada tarea"""
+    global _worker_public_key
+    _worker_public_key = PublicKey(*public_key)
+
+
+def _check_proof_job(job):
+    """Verifica una prueba NIZK (se ejecuta en un proceso del pool)"""
+    ciphertext, proof = job
+    return NIZKSystem.check_proof(ciphertext, proof, _worker_public_key)
+
 
 class VotingAuthority:
     """
@@ -28,10 +53,14 @@ class VotingAuthority:
         self.public_key= None
         self.registered_voters= []
     
-    def setup_election(self):
+    def setup_election(self, regenerate=False):
         """
         Configura el sistema electoral generando parámetros y claves
         
+        Args:
+            regenerate: Generar un primo seguro nuevo aunque exista un grupo
+                        estándar del tamaño configurado
+        
         Returns:
             Clave pública del sistema
         """
@@ -41,7 +70,7 @@ class VotingAuthority:
         print("█"*70)
         
         # Generar claves ElGamal
-        self.public_key, _ = self.elgamal.generate_keys()
+        self.public_key, _ = self.elgamal.generate_keys(regenerate)
         
         # Registrar en auditoría
         self.auditoria.registrar_evento('SETUP', {
@@ -66,20 +95,18 @@ class VotingAuthority:
         print("REGISTRO DE VOTANTES Y EMISIÓN DE TOKENS")
         print("="*70)
         
-        tokens = {}
+        tokens = self.token_system.issue_tokens_bulk(voter_ids)
+        self.registered_voters.extend(tokens)
         
-        for voter_id in voter_ids:
-            token = self.token_system.issue_token(voter_id)
-            tokens[voter_id] = token
-            self.registered_voters.append(voter_id)
+        for voter_id, token in tokens.items():
             print(f"  ✓ Votante registrado: {voter_id}")
             print(f"    Token: {token.token[:50]}...")
-            
-            # Registrar en auditoría
-            self.auditoria.registrar_evento('REGISTRO', {
-                'voter_id': voter_id,
-                'token_emitido': True
-            })
+        
+        # Registrar en auditoría todos los eventos de una vez
+        self.auditoria.registrar_eventos_bulk([
+            ('REGISTRO', {'voter_id': voter_id, 'token_emitido': True})
+            for voter_id in tokens
+        ])
         
         print(f"\nTotal de votantes registrados: {len(voter_ids)}")
         print("="*70)
@@ -118,9 +145,7 @@ class Voter:
         vote_bit = 1 if vote else 0
         
         # Cifrar el voto
-        elgamal_temp = ElGamalSystem()
-        elgamal_temp.public_key = public_key
-        ciphertext, randomness = elgamal_temp.encrypt(vote_bit, public_key)
+        ciphertext, randomness = encrypt_bit(vote_bit, public_key)
         
         # Generar prueba NIZK de validez
         proof = NIZKSystem.generate_proof(vote_bit, ciphertext, randomness, public_key)
@@ -133,7 +158,7 @@ class VotingCenter:
     Centro de Votación - Valida y registra votos
     """
     
-    def __init__(self, token_system, public_key, auditoria):
+    def __init__(self, token_system, public_key, auditoria, verbose=False):
         """
         Inicializa el centro de votación
         
@@ -141,12 +166,23 @@ class VotingCenter:
             token_system: Sistema de tokens para validación
             public_key: Clave pública del sistema
             auditoria: Sistema de auditoría
+            verbose: Si es True, muestra el detalle de cada voto procesado
         """
         self.token_system = token_system
         self.public_key = public_key
         self.auditoria = auditoria
+        self.verbose = verbose
         self.valid_votes= []
-        self.rejected_votes= []  # (voter_id, razón)
+        self.rejected_votes= []  # (voter_id, RejectReason, detalle)
+        self.reject_counter = Counter()
+        # Columnas paralelas a valid_votes para el recuento (estructura de arreglos)
+        self.valid_ciphertexts = []
+        self.valid_proofs = []
+    
+    def _log(self, *args):
+        """Imprime solo en modo verbose"""
+        if self.verbose:
+            print(*args)
     
     def receive_vote(self, encrypted_vote):
         """
@@ -160,45 +196,188 @@ class VotingCenter:
         """
         voter_id = encrypted_vote.voter_id
         
-        print(f"\n  → Procesando voto de {voter_id}...")
+        self._log(f"\n  → Procesando voto de {voter_id}...")
         
         # 1. Validar token
         is_valid, message = self.token_system.verify_token(encrypted_vote.token)
         if not is_valid:
-            print(f"    ✗ Token inválido: {message}")
-            self.rejected_votes.append((voter_id, f"Token inválido: {message}"))
+            self._log(f"    ✗ Token inválido: {message}")
+            self._reject_token(voter_id, message)
             return False
         
-        print(f"    ✓ Token válido")
+        self._log(f"    ✓ Token válido")
         
         # 2. Verificar prueba NIZK
-        proof_valid = NIZKSystem.verify_proof(
+        proof_valid, reason = NIZKSystem.check_proof(
             encrypted_vote.ciphertext,
             encrypted_vote.proof,
             self.public_key
         )
         
         if not proof_valid:
-            print(f"    ✗ Prueba NIZK inválida")
-            self.rejected_votes.append((voter_id, "Prueba NIZK inválida"))
+            self._log(f"    ✗ Prueba NIZK inválida: {reason}")
+            self._reject(voter_id, RejectReason.NIZK_INVALID, reason)
             return False
         
-        print(f"    ✓ Prueba NIZK verificada")
+        self._log(f"    ✓ Prueba NIZK verificada")
+        
+        # 3. Registrar voto, marcar token y registrar en auditoría
+        self._accept_vote(encrypted_vote)
         
-        # 3. Registrar voto y marcar token como usado
+        self._log(f"    ✓ Voto registrado exitosamente")
+        
+        return True
+    
+    def receive_votes_batch(self, encrypted_votes):
+        """
+        Recibe un lote de votos verificando todas sus pruebas NIZK a la vez
+        
+        Los tokens se validan uno por uno (es barato); las pruebas de los votos
+        con token válido se verifican en un solo lote y, si el lote falla, se
+        localizan las inválidas por bisección.
+        
+        Args:
+            encrypted_votes: Lista de votos cifrados con prueba y token
+        
+        Returns:
+            Lista de booleanos: True si el voto en esa posición fue aceptado
+        """
+        self._log(f"\n  → Procesando lote de {len(encrypted_votes)} votos...")
+        accepted = [False] * len(encrypted_votes)
+        
+        # 1. Validar tokens
+        candidates = self._screen_tokens(encrypted_votes)
+        
+        # 2. Verificar en lote las pruebas NIZK de los candidatos
+        ciphertexts = [encrypted_votes[i].ciphertext for i in candidates]
+        proofs = [encrypted_votes[i].proof for i in candidates]
+        if NIZKSystem.check_batch(ciphertexts, proofs, self.public_key)[0]:
+            invalid = set()
+        else:
+            invalid = set(NIZKSystem.find_invalid_proofs(ciphertexts, proofs, self.public_key))
+        
+        # 3. Registrar los votos válidos en el orden recibido (auditoría en bloque)
+        pending_audit = []
+        for j, i in enumerate(candidates):
+            vote = encrypted_votes[i]
+            if j in invalid:
+                reason = NIZKSystem.check_proof(vote.ciphertext, vote.proof, self.public_key)[1]
+                self._log(f"    ✗ {vote.voter_id}: prueba NIZK inválida: {reason}")
+                self._reject(vote.voter_id, RejectReason.NIZK_INVALID, reason)
+                continue
+            self._accept_vote(vote, pending_audit)
+            accepted[i] = True
+        self.auditoria.registrar_eventos_bulk(pending_audit)
+        
+        self._log(f"    ✓ {sum(accepted)} de {len(encrypted_votes)} votos registrados")
+        return accepted
+    
+    def receive_votes_parallel(self, encrypted_votes, workers=None):
+        """
+        Recibe un lote de votos verificando sus pruebas NIZK en varios procesos
+        
+        Los tokens se validan en el proceso principal (dependen del estado del
+        sistema de tokens); cada prueba se verifica por separado en el pool y
+        los votos válidos se registran después, en el orden recibido.
+        
+        Args:
+            encrypted_votes: Lista de votos cifrados con prueba y token
+            workers: Número de procesos (por defecto, uno por CPU)
+        
+        Returns:
+            Lista de booleanos: True si el voto en esa posición fue aceptado
+        """
+        self._log(f"\n  → Procesando {len(encrypted_votes)} votos en paralelo...")
+        accepted = [False] * len(encrypted_votes)
+        
+        # 1. Validar tokens
+        candidates = self._screen_tokens(encrypted_votes)
+        
+        # 2. Verificar pruebas NIZK; con pocos votos el pool no compensa
+        jobs = [(encrypted_votes[i].ciphertext, encrypted_votes[i].proof) for i in candidates]
+        workers = workers or os.cpu_count() or 1
+        if workers == 1 or len(jobs) < PARALLEL_MIN_VOTES:
+            results = [NIZKSystem.check_proof(ct, proof, self.public_key) for ct, proof in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(tuple(self.public_key),)) as executor:
+                chunksize = max(1, len(jobs) // (workers * 4))
+                results = list(executor.map(_check_proof_job, jobs, chunksize=chunksize))
+        
+        # 3. Registrar los votos válidos en el orden recibido (auditoría en bloque)
+        pending_audit = []
+        for i, (proof_valid, reason) in zip(candidates, results):
+            vote = encrypted_votes[i]
+            if not proof_valid:
+                self._log(f"    ✗ {vote.voter_id}: prueba NIZK inválida: {reason}")
+                self._reject(vote.voter_id, RejectReason.NIZK_INVALID, reason)
+                continue
+            self._accept_vote(vote, pending_audit)
+            accepted[i] = True
+        self.auditoria.registrar_eventos_bulk(pending_audit)
+        
+        self._log(f"    ✓ {sum(accepted)} de {len(encrypted_votes)} votos registrados")
+        return accepted
+    
+    def _screen_tokens(self, encrypted_votes):
+        """
+        Valida los tokens de un lote y rechaza los inválidos
+        
+        Un mismo token repetido dentro del lote cuenta como voto doble.
+        
+        Returns:
+            Índices de los votos con token válido
+        """
+        candidates = []
+        seen_tokens = set()
+        for i, vote in enumerate(encrypted_votes):
+            if vote.token in seen_tokens:
+                is_valid, message = False, TOKEN_USED
+            else:
+                is_valid, message = self.token_system.verify_token(vote.token)
+            if not is_valid:
+                self._log(f"    ✗ {vote.voter_id}: token inválido: {message}")
+                self._reject_token(vote.voter_id, message)
+                continue
+            seen_tokens.add(vote.token)
+            candidates.append(i)
+        return candidates
+    
+    def _reject(self, voter_id, reason, detail):
+        """Anota un voto rechazado con su motivo y el detalle del fallo"""
+        self.rejected_votes.append((voter_id, reason, detail))
+        self.reject_counter[reason] += 1
+    
+    def _reject_token(self, voter_id, message):
+        """Anota un voto rechazado por su token, distinguiendo el voto doble"""
+        reason = RejectReason.DUPLICATE if message == TOKEN_USED else RejectReason.TOKEN_INVALID
+        self._reject(voter_id, reason, message)
+    
+    def _accept_vote(self, encrypted_vote, pending_audit=None):
+        """
+        Registra un voto ya validado, marca su token y lo anota en auditoría
+        
+        Si se entrega pending_audit, el evento se agrega a esa lista para
+        registrarlo en bloque en lugar de hacerlo de inmediato.
+        """
+        # Los componentes se guardan como mpz para que la mezcla y la
+        # acumulación homomórfica no conviertan enteros en cada operación
+        ciphertext = Ciphertext(*map(gmpy2.mpz, encrypted_vote.ciphertext))
+        encrypted_vote = encrypted_vote._replace(ciphertext=ciphertext)
         self.valid_votes.append(encrypted_vote)
+        self.valid_ciphertexts.append(ciphertext)
+        self.valid_proofs.append(encrypted_vote.proof)
         self.token_system.mark_token_used(encrypted_vote.token)
         
-        # 4. Registrar en auditoría
-        self.auditoria.registrar_evento('VOTO', {
-            'voter_id': voter_id,
+        evento = ('VOTO', {
+            'voter_id': encrypted_vote.voter_id,
             'voto_valido': True,
             'nizk_verificado': True
         })
-        
-        print(f"    ✓ Voto registrado exitosamente")
-        
-        return True
+        if pending_audit is None:
+            self.auditoria.registrar_evento(*evento)
+        else:
+            pending_audit.append(evento)
     
     def get_valid_votes(self):
         """
@@ -207,16 +386,29 @@ class VotingCenter:
         Returns:
             Lista de cifrados válidos
         """
-        return [vote.ciphertext for vote in self.valid_votes]
+        return list(self.valid_ciphertexts)
+    
+    def get_valid_proofs(self):
+        """
+        Retorna las pruebas NIZK de los votos válidos
+        
+        Returns:
+            Lista de pruebas, en el mismo orden que get_valid_votes()
+        """
+        return list(self.valid_proofs)
     
     def get_statistics(self):
         """Retorna estadísticas del proceso de votación"""
+        n_valid = len(self.valid_votes)
+        n_rejected = len(self.rejected_votes)
+        n_registered = self.token_system.get_voter_count()
         return {
-            'total_votes': len(self.valid_votes) + len(self.rejected_votes),
-            'valid_votes': len(self.valid_votes),
-            'rejected_votes': len(self.rejected_votes),
-            'registered_voters': self.token_system.get_voter_count(),
-            'participation_rate': len(self.valid_votes) / self.token_system.get_voter_count() * 100
+            'total_votes': n_valid + n_rejected,
+            'valid_votes': n_valid,
+            'rejected_votes': n_rejected,
+            'rejections_by_reason': dict(self.reject_counter),
+            'registered_voters': n_registered,
+            'participation_rate': n_valid / n_registered * 100 if n_registered else 0.0
         }
 
 
@@ -225,75 +417,97 @@ class TallyingCenter:
     Centro de Recuento - Acumula votos y publica resultados
     """
     
-    def __init__(self, elgamal, auditoria, public_key):
+    def __init__(self, elgamal, auditoria, public_key, verbose=False,
+                 require_unlinkable_publication=True):
         """
         Inicializa el centro de recuento
         
         Args:
             elgamal: Sistema ElGamal con acceso a la clave privada
             auditoria: Sistema de auditoría
-            public_key: Clave pública para mixnet
+            public_key: Clave pública para mixnet y verificación de pruebas
+            verbose: Si es True, muestra el detalle de cada fase del recuento
+            require_unlinkable_publication: Si es False se omite la mezcla.
+                El producto homomórfico no depende del orden, así que el
+                resultado es el mismo; pero los cifrados acumulados quedan en
+                el orden de recepción, vinculados a cada votante. Usar False
+                solo si esos cifrados no se publican.
         """
         self.elgamal = elgamal
         self.auditoria = auditoria
-        self.mixnet = Mixnet(public_key)
+        self.public_key = public_key
+        self.verbose = verbose
+        self.require_unlinkable_publication = require_unlinkable_publication
+        self.mixnet = Mixnet(public_key, verbose=verbose)
     
-    def tally_votes(self, encrypted_votes):
+    def _log(self, *args):
+        """Imprime solo en modo verbose"""
+        if self.verbose:
+            print(*args)
+    
+    def tally_votes(self, encrypted_votes, proofs=None):
         """
         Recuenta los votos usando acumulación homomórfica
         
         Args:
             encrypted_votes: Lista de votos cifrados
+            proofs: Pruebas NIZK de los votos (opcional). Si se entregan, se
+                    verifican todas en un solo lote antes de acumular; los
+                    votos con pruebas inválidas se excluyen del recuento y se
+                    registran en auditoría
         
         Returns:
             Tupla (votos_a_favor, votos_en_contra)
         """
-        print("\n" + "="*70)
-        print("RECUENTO DE VOTOS - ACUMULACIÓN HOMOMÓRFICA")
-        print("="*70)
+        if proofs is not None and len(proofs) != len(encrypted_votes):
+            raise ValueError("El número de pruebas NIZK no coincide con el de votos")
+        
+        self._log("\n" + "="*70)
+        self._log("RECUENTO DE VOTOS - ACUMULACIÓN HOMOMÓRFICA")
+        self._log("="*70)
         
         if not encrypted_votes:
-            print("No hay votos para contar")
+            self._log("No hay votos para contar")
             return 0, 0
         
-        print(f"\nTotal de votos cifrados recibidos: {len(encrypted_votes)}")
+        self._log(f"\nTotal de votos cifrados recibidos: {len(encrypted_votes)}")
         
         # Mostrar algunos votos cifrados (incomprensibles sin la clave)
-        print("\nEjemplos de votos cifrados (imposible determinar el voto individual):")
+        self._log("\nEjemplos de votos cifrados (imposible determinar el voto individual):")
         for i, ct in enumerate(encrypted_votes[:3], 1):
-            print(f"  Voto {i}: (v={ct.v % 10000}..., e={ct.e % 10000}...)")
-        
-        # PASO 1: Mezclar votos con Mixnet
-        print("\n" + "="*70)
-        print("FASE DE MEZCLA (MIXNET) - Romper trazabilidad")
-        print("="*70)
-        
-        mixed_votes, mix_proof = self.mixnet.shuffle_and_recrypt(encrypted_votes)
-        
-        # Verificar mezcla
-        if not self.mixnet.verify_mix(encrypted_votes, mixed_votes, mix_proof):
-            print("  ✗ Error: Mezcla inválida")
-            return 0, 0
-        
-        # Registrar mezcla en auditoría
-        self.auditoria.registrar_evento('MEZCLA', {
-            'votos_originales': len(encrypted_votes),
-            'votos_mezclados': len(mixed_votes),
-            'mezcla_verificada': True
-        })
-        
-        print("="*70)
+            self._log(f"  Voto {i}: (v={ct.v % 10000}..., e={ct.e % 10000}...)")
+        
+        # PASO 0: Verificar en lote las pruebas NIZK recibidas
+        if proofs is not None:
+            self._log("\n→ Verificando pruebas NIZK en lote...")
+            valid, reason = NIZKSystem.parallel_check_batch(encrypted_votes, proofs, self.public_key)
+            if valid:
+                self._log(f"  ✓ {len(proofs)} pruebas NIZK verificadas en lote")
+            else:
+                self._log(f"  ✗ Verificación por lotes: {reason}")
+                encrypted_votes = self._exclude_invalid(encrypted_votes, proofs)
+                if not encrypted_votes:
+                    return 0, 0
+        
+        # PASO 1: Mezclar votos con Mixnet (solo si se publicarán los cifrados)
+        if self.require_unlinkable_publication:
+            mixed_votes = self._mix(encrypted_votes)
+            if mixed_votes is None:
+                return 0, 0
+        else:
+            self._log("\n→ Mezcla omitida: no se publican los cifrados individuales")
+            mixed_votes = encrypted_votes
         
         # PASO 2: Acumular votos mezclados homomórficamente
-        print("\n→ Multiplicando todos los cifrados homomórficamente...")
+        self._log("\n→ Multiplicando todos los cifrados homomórficamente...")
         aggregated = self.elgamal.homomorphic_add(mixed_votes)
         
-        print(f"  Cifrado agregado calculado:")
-        print(f"  v* = {aggregated.v % 10000}...")
-        print(f"  e* = {aggregated.e % 10000}...")
+        self._log(f"  Cifrado agregado calculado:")
+        self._log(f"  v* = {aggregated.v % 10000}...")
+        self._log(f"  e* = {aggregated.e % 10000}...")
         
         # Descifrar el agregado
-        print("\n→ Descifrando el voto agregado...")
+        self._log("\n→ Descifrando el voto agregado...")
         total_yes = self.elgamal.decrypt_sum(aggregated, len(mixed_votes))
         
         total_no = len(mixed_votes) - total_yes
@@ -305,11 +519,45 @@ class TallyingCenter:
             'votos_contra': total_no
         })
         
-        print(f"\n✓ Suma de votos desencriptada: {total_yes}")
-        print("="*70)
+        self._log(f"\n✓ Suma de votos desencriptada: {total_yes}")
+        self._log("="*70)
         
         return total_yes, total_no
     
+    def _exclude_invalid(self, encrypted_votes, proofs):
+        """Localiza los votos con pruebas inválidas, los registra y retorna el resto"""
+        invalid = NIZKSystem.find_invalid_proofs(encrypted_votes, proofs, self.public_key)
+        self._log(f"  ✗ {len(invalid)} pruebas NIZK inválidas; votos excluidos: {invalid}")
+        self.auditoria.registrar_evento('VOTOS_EXCLUIDOS', {
+            'indices': invalid,
+            'motivo': 'prueba NIZK inválida'
+        })
+        excluded = set(invalid)
+        return [ct for i, ct in enumerate(encrypted_votes) if i not in excluded]
+    
+    def _mix(self, encrypted_votes):
+        """Mezcla y re-cifra los votos; retorna None si la mezcla no verifica"""
+        self._log("\n" + "="*70)
+        self._log("FASE DE MEZCLA (MIXNET) - Romper trazabilidad")
+        self._log("="*70)
+        
+        mixed_votes, mix_proof = self.mixnet.shuffle_and_recrypt(encrypted_votes)
+        
+        # Verificar mezcla
+        if not self.mixnet.verify_mix(encrypted_votes, mixed_votes, mix_proof):
+            self._log("  ✗ Error: Mezcla inválida")
+            return None
+        
+        # Registrar mezcla en auditoría
+        self.auditoria.registrar_evento('MEZCLA', {
+            'votos_originales': len(encrypted_votes),
+            'votos_mezclados': len(mixed_votes),
+            'mezcla_verificada': True
+        })
+        
+        self._log("="*70)
+        return mixed_votes
+    
     def publish_results(self, yes_votes, no_votes, stats):
         """
         Publica los resultados finales de la votación
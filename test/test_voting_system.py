@@ -6,18 +6,48 @@ O simplemente: python test_voting_system.py
 
 import sys
 import os
+import json
+import math
+import random
+import time
 import unittest
+from unittest import mock
+from functools import lru_cache
+from datetime import datetime
+import gmpy2
 
 # Agregar el directorio src al path para imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
-from crypto_utils import is_prime, generate_safe_prime, find_generator, mod_inverse, discrete_log_small
-from elgamal import ElGamalSystem
+from crypto_utils import is_prime, generate_safe_prime, find_generator, mod_inverse, discrete_log_small, FixedBaseTable, fixed_base_table, fixed_pow_pair, batch_fixed_pow, hash_ints, hash_to_challenge
+from elgamal import ElGamalSystem, standard_group, encrypt_bit
+import nizk
 from nizk import NIZKSystem
 from token_system import TokenSystem
-from voting_system import VotingAuthority, Voter, VotingCenter
+import voting_system
+from voting_system import VotingAuthority, Voter, VotingCenter, RejectReason
 from mixnet import Mixnet
-from auditoria import SistemaAuditoria
+from auditoria import SistemaAuditoria, serializar_canonico
+
+
+# Tamaño de los parámetros en las pruebas de corrección (cifrado, NIZK, mezcla).
+# Las propiedades probadas no dependen del tamaño; TestSecurityParameters hace
+# además una prueba con 256 bits. Para una corrida completa: TEST_BITS=512
+TEST_BITS = int(os.environ.get("TEST_BITS", 64))
+
+# Pruebas de escala (miles de eventos o votos), solo con RUN_SLOW=1
+RUN_SLOW = os.environ.get("RUN_SLOW") == "1"
+
+
+@lru_cache(maxsize=8)
+def _cached_safe_prime(bits):
+    """Primo seguro compartido por todas las pruebas de un mismo tamaño"""
+    return generate_safe_prime(bits)
+
+
+def _shared_prime():
+    """Hace que la generación de claves use el primo seguro cacheado (α sigue siendo nuevo)"""
+    return mock.patch('elgamal.generate_safe_prime', _cached_safe_prime)
 
 
 class TestCryptoUtils(unittest.TestCase):
@@ -25,18 +55,24 @@ class TestCryptoUtils(unittest.TestCase):
     
     def test_is_prime(self):
         """Probar detección de primalidad"""
-        # Primos conocidos
-        self.assertTrue(is_prime(2))
-        self.assertTrue(is_prime(3))
-        self.assertTrue(is_prime(5))
-        self.assertTrue(is_prime(17))
-        self.assertTrue(is_prime(97))
-        
-        # No primos
-        self.assertFalse(is_prime(1))
-        self.assertFalse(is_prime(4))
-        self.assertFalse(is_prime(15))
-        self.assertFalse(is_prime(100))
+        # Primos conocidos y no primos
+        casos = [(2, True), (3, True), (5, True), (17, True), (97, True),
+                 (1, False), (4, False), (15, False), (100, False)]
+        for n, esperado in casos:
+            with self.subTest(n=n):
+                self.assertEqual(bool(is_prime(n)), esperado)
+    
+    def test_is_prime_contra_criba(self):
+        """Probar is_prime contra una criba de Eratóstenes para n < 10000"""
+        limite = 10000
+        criba = bytearray([1]) * limite
+        criba[0] = criba[1] = 0
+        for i in range(2, math.isqrt(limite) + 1):
+            if criba[i]:
+                criba[i * i::i] = bytes(len(range(i * i, limite, i)))
+        
+        errores = [n for n in range(limite) if bool(is_prime(n)) != bool(criba[n])]
+        self.assertEqual(errores, [])
     
     def test_safe_prime_generation(self):
         """Probar generación de primos seguros"""
@@ -71,15 +107,72 @@ class TestCryptoUtils(unittest.TestCase):
         
         self.assertEqual(x, 7)
         self.assertEqual(pow(g, x, p), h)
+    
+    def test_discrete_log_small_rango_amplio(self):
+        """Probar Baby-Step Giant-Step con exponentes conocidos hasta 10000"""
+        p, q = _cached_safe_prime(64)
+        g = 4  # Residuo cuadrático: genera el subgrupo de orden q
+        n = 10000
+        m = math.isqrt(n) + 1
+        
+        # Bordes de los pasos pequeños y gigantes, y valores aleatorios
+        for x in [0, 1, m - 1, m, m + 1, 2 * m, n - m, n - 1, n] + random.sample(range(n), 20):
+            self.assertEqual(discrete_log_small(g, pow(g, x, p), p, max_value=n), x)
+        
+        with self.assertRaises(ValueError):
+            discrete_log_small(g, pow(g, n + 1, p), p, max_value=n)
+    
+    def test_fixed_base_table(self):
+        """Probar exponenciación de base fija contra pow"""
+        p, g = 1019, 2
+        table = FixedBaseTable(g, p, bits=10)
+        
+        for exp in [0, 1, 63, 64, 509, 1023]:
+            self.assertEqual(table.pow(exp), pow(g, exp, p))
+        
+        # Exponente fuera del rango de la tabla
+        self.assertEqual(table.pow(5000), pow(g, 5000, p))
+        
+        # La caché de tablas está acotada: no retiene una tabla por cada base usada
+        for base in range(2, 20):
+            fixed_base_table(base, p, 10)
+        self.assertLessEqual(fixed_base_table.cache_info().currsize, 8)
+    
+    def test_fixed_pow_pair(self):
+        """Probar exponenciación simultánea de dos bases fijas"""
+        p = 1019
+        tabla_a = FixedBaseTable(2, p, bits=10)
+        tabla_b = FixedBaseTable(3, p, bits=10)
+        for exp in [0, 1, 63, 64, 509, 1000]:
+            self.assertEqual(fixed_pow_pair(tabla_a, tabla_b, exp), (pow(2, exp, p), pow(3, exp, p)))
+    
+    def test_hash_ints(self):
+        """Probar que hash_ints coincide con hash_to_challenge para enteros"""
+        elementos = (0, 1, 255, 256, 2**521 - 1)
+        self.assertEqual(hash_ints(*elementos), hash_to_challenge(*elementos))
+        self.assertNotEqual(hash_ints(1, 23), hash_ints(12, 3))
+        self.assertEqual(hash_ints(*map(gmpy2.mpz, elementos)), hash_ints(*elementos))
+    
+    def test_batch_fixed_pow(self):
+        """Probar exponenciación de base fija en lote"""
+        p = 1019
+        exps = [0, 1, 2, 509, 1000, 12345]
+        self.assertEqual(batch_fixed_pow(2, exps, p), [pow(2, e, p) for e in exps])
+        self.assertEqual(batch_fixed_pow(3, exps, p, bits=9), [pow(3, e, p) for e in exps])
 
 
 class TestElGamal(unittest.TestCase):
     """Pruebas para el sistema ElGamal"""
     
-    def setUp(self):
-        """Configurar sistema ElGamal para pruebas"""
-        self.system = ElGamalSystem(bits=128)
-        self.public_key, self.private_key = self.system.generate_keys()
+    @classmethod
+    def setUpClass(cls):
+        """Configurar una sola vez el sistema ElGamal (cifrar y descifrar no lo modifican)"""
+        cls.system = ElGamalSystem(bits=TEST_BITS)
+        with _shared_prime():
+            cls.public_key, cls.private_key = cls.system.generate_keys()
+        # Cifrados de referencia reutilizados por las pruebas de acumulación
+        cls.enc0, _ = cls.system.encrypt(0)
+        cls.enc1, _ = cls.system.encrypt(1)
     
     def test_encrypt_decrypt_zero(self):
         """Probar cifrado y descifrado de 0"""
@@ -97,6 +190,12 @@ class TestElGamal(unittest.TestCase):
         # Debe descifrar a g^1 = g
         self.assertEqual(decrypted, self.public_key.g)
     
+    def test_encrypt_bit_sin_instancia(self):
+        """Probar que encrypt_bit cifra solo con la clave pública"""
+        for bit, esperado in ((0, 1), (1, self.public_key.g)):
+            ciphertext, _ = encrypt_bit(bit, self.public_key)
+            self.assertEqual(self.system.decrypt(ciphertext), esperado)
+    
     def test_invalid_message(self):
         """Probar que se rechacen mensajes inválidos"""
         with self.assertRaises(ValueError):
@@ -126,7 +225,7 @@ class TestElGamal(unittest.TestCase):
     def test_homomorphic_all_zeros(self):
         """Probar acumulación de solo ceros"""
         votes = [0, 0, 0, 0]
-        ciphertexts = [self.system.encrypt(v)[0] for v in votes]
+        ciphertexts = [self.enc1 if v else self.enc0 for v in votes]
         
         aggregated = self.system.homomorphic_add(ciphertexts)
         suma = self.system.decrypt_sum(aggregated, max_sum=len(votes))
@@ -136,21 +235,34 @@ class TestElGamal(unittest.TestCase):
     def test_homomorphic_all_ones(self):
         """Probar acumulación de solo unos"""
         votes = [1, 1, 1, 1, 1]
-        ciphertexts = [self.system.encrypt(v)[0] for v in votes]
+        ciphertexts = [self.enc1 if v else self.enc0 for v in votes]
         
         aggregated = self.system.homomorphic_add(ciphertexts)
         suma = self.system.decrypt_sum(aggregated, max_sum=len(votes))
         
         self.assertEqual(suma, 5)
+    
+    def test_standard_groups(self):
+        """Probar que los grupos estándar son primos seguros con g de orden q"""
+        for bits in (2048, 3072, 4096):
+            p, q, g = standard_group(bits)
+            self.assertEqual(p.bit_length(), bits)
+            self.assertEqual(p, 2 * q + 1)
+            self.assertTrue(is_prime(p) and is_prime(q))
+            self.assertEqual(pow(g, q, p), 1)
+        
+        self.assertIsNone(standard_group(128))
 
 
 class TestNIZK(unittest.TestCase):
     """Pruebas para el sistema NIZK"""
     
-    def setUp(self):
-        """Configurar sistema para pruebas NIZK"""
-        self.system = ElGamalSystem(bits=128)
-        self.public_key, _ = self.system.generate_keys()
+    @classmethod
+    def setUpClass(cls):
+        """Configurar una sola vez el sistema para pruebas NIZK"""
+        cls.system = ElGamalSystem(bits=TEST_BITS)
+        with _shared_prime():
+            cls.public_key, _ = cls.system.generate_keys()
     
     def test_nizk_proof_for_zero(self):
         """Probar generación y verificación de prueba para 0"""
@@ -182,6 +294,62 @@ class TestNIZK(unittest.TestCase):
             is_valid = NIZKSystem.verify_proof(ciphertext, proof, self.public_key)
             
             self.assertTrue(is_valid)
+    
+    def test_nizk_proof_alterada(self):
+        """Probar que una prueba alterada o ajena es rechazada"""
+        ciphertext, randomness = self.system.encrypt(1)
+        proof = NIZKSystem.generate_proof(1, ciphertext, randomness, self.public_key)
+        
+        alterada = proof._replace(z2=(proof.z2 + 1) % self.public_key.q)
+        self.assertFalse(NIZKSystem.verify_proof(ciphertext, alterada, self.public_key))
+        self.assertEqual(NIZKSystem.check_proof(ciphertext, alterada, self.public_key),
+                         (False, "falló la rama 2 (v)"))
+        
+        otro_ciphertext, _ = self.system.encrypt(1)
+        self.assertFalse(NIZKSystem.verify_proof(otro_ciphertext, proof, self.public_key))
+    
+    def test_nizk_proof_fuera_del_subgrupo(self):
+        """Probar que un cifrado con v fuera del subgrupo es rechazado"""
+        ciphertext, randomness = self.system.encrypt(0)
+        proof = NIZKSystem.generate_proof(0, ciphertext, randomness, self.public_key)
+        
+        # -v tiene símbolo de Jacobi -1 cuando p ≡ 3 (mod 4)
+        v, e = ciphertext
+        negado = (self.public_key.p - v, e)
+        self.assertEqual(NIZKSystem.check_proof(negado, proof, self.public_key),
+                         (False, "elemento fuera del subgrupo"))
+        self.assertEqual(NIZKSystem.check_proof((-v, e), proof, self.public_key),
+                         (False, "elemento fuera del subgrupo"))
+    
+    def test_nizk_check_batch(self):
+        """Probar verificación por lotes de pruebas NIZK"""
+        ciphertexts, proofs = [], []
+        for i in range(6):
+            vote = i % 2
+            ciphertext, randomness = self.system.encrypt(vote)
+            ciphertexts.append(ciphertext)
+            proofs.append(NIZKSystem.generate_proof(vote, ciphertext, randomness, self.public_key))
+        
+        self.assertEqual(NIZKSystem.check_batch(ciphertexts, proofs, self.public_key), (True, "Lote válido"))
+        
+        # Una sola prueba alterada invalida el lote
+        proofs[3] = proofs[3]._replace(z1=(proofs[3].z1 + 1) % self.public_key.q)
+        self.assertFalse(NIZKSystem.check_batch(ciphertexts, proofs, self.public_key)[0])
+    
+    def test_nizk_parallel_check_batch(self):
+        """Probar verificación por lotes repartida entre procesos"""
+        ciphertexts, proofs = [], []
+        for i in range(8):
+            ciphertext, randomness = self.system.encrypt(i % 2)
+            ciphertexts.append(ciphertext)
+            proofs.append(NIZKSystem.generate_proof(i % 2, ciphertext, randomness, self.public_key))
+        
+        with mock.patch.object(nizk, 'PARALLEL_MIN_PROOFS', 4):
+            self.assertTrue(NIZKSystem.parallel_check_batch(ciphertexts, proofs, self.public_key, workers=2)[0])
+            
+            # La prueba alterada cae en el segundo tramo
+            proofs[6] = proofs[6]._replace(z2=(proofs[6].z2 + 1) % self.public_key.q)
+            self.assertFalse(NIZKSystem.parallel_check_batch(ciphertexts, proofs, self.public_key, workers=2)[0])
 
 
 class TestTokenSystem(unittest.TestCase):
@@ -197,7 +365,22 @@ class TestTokenSystem(unittest.TestCase):
         
         self.assertEqual(token.voter_id, "Alice")
         self.assertIsNotNone(token.token)
-        self.assertIsNotNone(token.issued_at)
+        # Fecha de emisión en formato ISO-8601
+        self.assertIsInstance(datetime.fromisoformat(token.issued_at), datetime)
+    
+    def test_issue_tokens_bulk(self):
+        """Probar emisión de tokens en lote"""
+        tokens = self.token_system.issue_tokens_bulk(["Ana", "Luis", "Eva"])
+        
+        self.assertEqual(list(tokens), ["Ana", "Luis", "Eva"])
+        self.assertEqual(len({t.token for t in tokens.values()}), 3)
+        for token in tokens.values():
+            self.assertTrue(self.token_system.verify_token(token.token)[0])
+        
+        # Un lote con un votante ya registrado no emite ningún token
+        with self.assertRaises(ValueError):
+            self.token_system.issue_tokens_bulk(["Nuevo", "Ana"])
+        self.assertNotIn("Nuevo", self.token_system.voters)
     
     def test_verify_valid_token(self):
         """Probar verificación de token válido"""
@@ -207,12 +390,22 @@ class TestTokenSystem(unittest.TestCase):
         
         self.assertTrue(is_valid)
         self.assertEqual(msg, "Token válido")
+        
+        # Identificadores con caracteres no ASCII
+        token = self.token_system.issue_token("José")
+        self.assertTrue(self.token_system.verify_token(token.token)[0])
     
     def test_verify_invalid_token(self):
         """Probar verificación de token inválido"""
         is_valid, msg = self.token_system.verify_token("fake_token")
         
         self.assertFalse(is_valid)
+        
+        # Token con formato correcto pero MAC distinta
+        token = self.token_system.issue_token("Eva").token
+        is_valid, msg = self.token_system.verify_token(token[:-1] + ('0' if token[-1] != '0' else '1'))
+        self.assertFalse(is_valid)
+        self.assertEqual(msg, "Token no coincide con el emitido")
     
     def test_double_voting_prevention(self):
         """Probar prevención de voto doble"""
@@ -260,10 +453,18 @@ class TestTokenSystem(unittest.TestCase):
 class TestVotingSystem(unittest.TestCase):
     """Pruebas de integración para el sistema completo"""
     
+    @classmethod
+    def setUpClass(cls):
+        """Configurar una sola vez la autoridad y las claves de la elección"""
+        cls.authority = VotingAuthority(bits=TEST_BITS)
+        with _shared_prime():
+            cls.public_key = cls.authority.setup_election()
+    
     def setUp(self):
-        """Configurar sistema de votación completo"""
-        self.authority = VotingAuthority(bits=128)
-        self.public_key = self.authority.setup_election()
+        """Registrar votantes con tokens y auditoría nuevos en cada prueba"""
+        self.authority.token_system = TokenSystem()
+        self.authority.auditoria = SistemaAuditoria()
+        self.authority.registered_voters = []
         
         self.voter_ids = ["Alice", "Bob", "Charlie"]
         self.tokens = self.authority.register_voters(self.voter_ids)
@@ -300,7 +501,63 @@ class TestVotingSystem(unittest.TestCase):
         
         # Solo debe haber un voto registrado
         self.assertEqual(len(self.voting_center.valid_votes), 1)
+
+    def test_statistics_without_voters(self):
+        """Probar estadísticas de un centro sin votantes registrados"""
+        auditoria = SistemaAuditoria()
+        center = VotingCenter(TokenSystem(), self.public_key, auditoria)
+        
+        stats = center.get_statistics()
+        self.assertEqual(stats['participation_rate'], 0.0)
+        self.assertEqual(stats['total_votes'], 0)
     
+    def test_quiet_by_default(self):
+        """Probar que los centros de votación y recuento no imprimen sin verbose"""
+        vote = Voter("Alice", self.tokens["Alice"]).cast_vote(True, self.public_key)
+        with mock.patch('builtins.print') as fake_print:
+            self.assertTrue(self.voting_center.receive_vote(vote))
+        fake_print.assert_not_called()
+        
+        # Recuento con una prueba inválida: tampoco imprime al rechazar el lote
+        from voting_system import TallyingCenter
+        tallying = TallyingCenter(self.authority.elgamal, self.authority.auditoria, self.public_key)
+        otro = Voter("Bob", self.tokens["Bob"]).cast_vote(False, self.public_key)
+        alterada = otro.proof._replace(z2=(otro.proof.z2 + 1) % self.public_key.q)
+        with mock.patch('builtins.print') as fake_print:
+            self.assertEqual(tallying.tally_votes([vote.ciphertext, otro.ciphertext],
+                                                 [vote.proof, alterada]), (1, 0))
+        fake_print.assert_not_called()
+
+    def test_batch_intake_rejects_bad_proof_and_double_vote(self):
+        """Probar recepción en lote con una prueba alterada y un voto doble"""
+        votes = [Voter(v, self.tokens[v]).cast_vote(True, self.public_key)
+                 for v in self.voter_ids]
+        proof = votes[1].proof
+        votes[1] = votes[1]._replace(proof=proof._replace(z1=(proof.z1 + 1) % self.public_key.q))
+        votes.append(Voter("Alice", self.tokens["Alice"]).cast_vote(False, self.public_key))
+
+        accepted = self.voting_center.receive_votes_batch(votes)
+
+        self.assertEqual(accepted, [True, False, True, False])
+        self.assertEqual(len(self.voting_center.valid_votes), 2)
+        self.assertEqual(len(self.voting_center.rejected_votes), 2)
+        self.assertEqual(self.voting_center.get_statistics()['rejections_by_reason'],
+                         {RejectReason.NIZK_INVALID: 1, RejectReason.DUPLICATE: 1})
+
+    def test_parallel_intake_rejects_bad_proof(self):
+        """Probar recepción con pruebas verificadas en un pool de procesos"""
+        votes = [Voter(v, self.tokens[v]).cast_vote(False, self.public_key)
+                 for v in self.voter_ids]
+        proof = votes[2].proof
+        votes[2] = votes[2]._replace(proof=proof._replace(c1=(proof.c1 + 1) % self.public_key.q))
+
+        with mock.patch.object(voting_system, 'PARALLEL_MIN_VOTES', 2):
+            accepted = self.voting_center.receive_votes_parallel(votes, workers=2)
+
+        self.assertEqual(accepted, [True, True, False])
+        self.assertEqual(self.voting_center.rejected_votes[0][1:],
+                         (RejectReason.NIZK_INVALID, "c1 + c2 ≠ c"))
+
     def test_full_election_cycle(self):
         """Probar ciclo completo de elección"""
         # Todos votan
@@ -310,12 +567,14 @@ class TestVotingSystem(unittest.TestCase):
             ("Charlie", True)
         ]
         
-        for voter_id, vote_choice in votes:
-            voter = Voter(voter_id, self.tokens[voter_id])
-            encrypted_vote = voter.cast_vote(vote_choice, self.public_key)
-            self.voting_center.receive_vote(encrypted_vote)
+        # Enviar todos los votos en un lote (pruebas NIZK verificadas juntas)
+        accepted = self.voting_center.receive_votes_batch([
+            Voter(voter_id, self.tokens[voter_id]).cast_vote(vote_choice, self.public_key)
+            for voter_id, vote_choice in votes
+        ])
         
         # Verificar todos fueron aceptados
+        self.assertEqual(accepted, [True, True, True])
         self.assertEqual(len(self.voting_center.valid_votes), 3)
         
         # Realizar recuento
@@ -323,12 +582,53 @@ class TestVotingSystem(unittest.TestCase):
         tallying = TallyingCenter(self.authority.elgamal, self.authority.auditoria, self.public_key)
         
         valid_ciphertexts = self.voting_center.get_valid_votes()
-        yes_count, no_count = tallying.tally_votes(valid_ciphertexts)
+        valid_proofs = self.voting_center.get_valid_proofs()
+        yes_count, no_count = tallying.tally_votes(valid_ciphertexts, valid_proofs)
         
         # Verificar resultados
         self.assertEqual(yes_count, 2)  # Alice y Charlie votaron SÍ
         self.assertEqual(no_count, 1)   # Bob votó NO
         self.assertEqual(yes_count + no_count, 3)
+    
+    def test_tally_excludes_invalid_proofs(self):
+        """Probar que el recuento excluye y registra los votos con pruebas inválidas"""
+        votes = [Voter(v, self.tokens[v]).cast_vote(choice, self.public_key)
+                 for v, choice in [("Alice", True), ("Bob", False), ("Charlie", True)]]
+        ciphertexts = [vote.ciphertext for vote in votes]
+        proofs = [vote.proof for vote in votes]
+        proofs[2] = proofs[2]._replace(z1=(proofs[2].z1 + 1) % self.public_key.q)
+        
+        from voting_system import TallyingCenter
+        tallying = TallyingCenter(self.authority.elgamal, self.authority.auditoria, self.public_key)
+        
+        self.assertEqual(tallying.tally_votes(ciphertexts, proofs), (1, 1))
+        excluidos = [e for e in self.authority.auditoria.eventos if e.tipo == 'VOTOS_EXCLUIDOS']
+        self.assertEqual(excluidos[0].datos['indices'], [2])
+        with self.assertRaises(ValueError):
+            tallying.tally_votes(ciphertexts, proofs[:2])
+    
+    def test_tally_without_mixing(self):
+        """Probar que el recuento sin mezcla da el mismo resultado"""
+        for voter_id, vote_choice in [("Alice", True), ("Bob", True), ("Charlie", False)]:
+            voter = Voter(voter_id, self.tokens[voter_id])
+            self.voting_center.receive_vote(voter.cast_vote(vote_choice, self.public_key))
+        
+        from voting_system import TallyingCenter
+        tallying = TallyingCenter(self.authority.elgamal, self.authority.auditoria, self.public_key,
+                                  require_unlinkable_publication=False)
+        
+        self.assertEqual(tallying.tally_votes(self.voting_center.get_valid_votes()), (2, 1))
+        self.assertNotIn('MEZCLA', self.authority.auditoria.obtener_estadisticas()['eventos_por_tipo'])
+    
+    @unittest.skipUnless(RUN_SLOW, "prueba lenta: usar RUN_SLOW=1")
+    def test_tally_1000_votes(self):
+        """Probar el recuento de 1000 votos sintéticos con mezcla"""
+        from voting_system import TallyingCenter
+        votes = [random.randrange(2) for _ in range(1000)]
+        ciphertexts = [self.authority.elgamal.encrypt(v)[0] for v in votes]
+        
+        tallying = TallyingCenter(self.authority.elgamal, self.authority.auditoria, self.public_key)
+        self.assertEqual(tallying.tally_votes(ciphertexts), (sum(votes), len(votes) - sum(votes)))
 
 
 class TestMixnet(unittest.TestCase):
@@ -337,8 +637,9 @@ class TestMixnet(unittest.TestCase):
     def test_shuffle_and_recrypt(self):
         """Probar mezcla y re-cifrado de votos"""
         # Setup
-        elgamal = ElGamalSystem(bits=128)
-        public_key, _ = elgamal.generate_keys()
+        elgamal = ElGamalSystem(bits=TEST_BITS)
+        with _shared_prime():
+            public_key, _ = elgamal.generate_keys()
         mixnet = Mixnet(public_key)
         
         # Crear votos cifrados
@@ -357,14 +658,20 @@ class TestMixnet(unittest.TestCase):
     
     def test_mix_verification(self):
         """Probar verificación de mezcla"""
-        elgamal = ElGamalSystem(bits=128)
-        public_key, _ = elgamal.generate_keys()
+        elgamal = ElGamalSystem(bits=TEST_BITS)
+        with _shared_prime():
+            public_key, _ = elgamal.generate_keys()
         mixnet = Mixnet(public_key)
         
         votes = [elgamal.encrypt(1, public_key)[0]]  # Solo el ciphertext
         mixed_votes, proof = mixnet.shuffle_and_recrypt(votes)
         
         self.assertTrue(mixnet.verify_mix(votes, mixed_votes, proof))
+        
+        # Con un solo voto la permutación es siempre la identidad: el nonce de
+        # ocultamiento debe hacer que el commitment cambie en cada mezcla
+        _, otra_proof = mixnet.shuffle_and_recrypt(votes)
+        self.assertNotEqual(proof.permutation_commitment, otra_proof.permutation_commitment)
 
 
 class TestAuditoria(unittest.TestCase):
@@ -404,26 +711,147 @@ class TestAuditoria(unittest.TestCase):
                 auditoria.eventos[i].hash_previo,
                 auditoria.eventos[i-1].hash_actual
             )
+    
+    @unittest.skipUnless(RUN_SLOW, "prueba lenta: usar RUN_SLOW=1")
+    def test_cadena_eventos_grande(self):
+        """Probar una cadena de 10000 eventos"""
+        auditoria = SistemaAuditoria()
+        for i in range(10_000):
+            auditoria.registrar_evento('VOTO', {'n': i})
+        
+        eventos = auditoria.eventos
+        self.assertTrue(all(b.hash_previo == a.hash_actual for a, b in zip(eventos, eventos[1:])))
+        self.assertTrue(auditoria.verificar_integridad())
+    
+    def test_estadisticas_integridad_en_cache(self):
+        """Probar que las estadísticas reutilizan la última verificación"""
+        auditoria = SistemaAuditoria()
+        auditoria.registrar_evento('VOTO', {})
+        auditoria.registrar_evento('VOTO', {})
+        
+        stats = auditoria.obtener_estadisticas()
+        self.assertTrue(stats['integridad_verificada'])
+        self.assertEqual(stats['eventos_por_tipo'], {'VOTO': 2})
+        
+        # Una alteración posterior solo se detecta al forzar la revalidación
+        auditoria.eventos[0] = auditoria.eventos[0]._replace(datos={'x': 1})
+        self.assertTrue(auditoria.obtener_estadisticas()['integridad_verificada'])
+        self.assertFalse(auditoria.obtener_estadisticas(force=True)['integridad_verificada'])
+    
+    def test_serializacion_canonica(self):
+        """Probar que la serialización no depende del orden de inserción"""
+        datos = {'voter_id': 'Alice', 'voto_valido': True, 'n': [1, -2, None]}
+        invertido = dict(reversed(list(datos.items())))
+        
+        self.assertEqual(serializar_canonico(datos), serializar_canonico(invertido))
+        self.assertNotEqual(serializar_canonico({'a': 1}), serializar_canonico({'a': '1'}))
+        self.assertNotEqual(serializar_canonico(0.5), serializar_canonico('0.5'))
+        self.assertEqual(serializar_canonico(gmpy2.mpz(7)), serializar_canonico(7))
+        with self.assertRaises(TypeError):
+            serializar_canonico(object())
+    
+    def test_prueba_inclusion_merkle(self):
+        """Probar pruebas de inclusión del árbol de Merkle"""
+        auditoria = SistemaAuditoria()
+        
+        for i in range(5):
+            auditoria.registrar_evento('VOTO', {'n': i})
+        
+        raiz = auditoria.raiz_merkle()
+        for i, evento in enumerate(auditoria.eventos):
+            prueba = auditoria.prueba_inclusion(i)
+            self.assertTrue(SistemaAuditoria.verificar_inclusion(evento, prueba, raiz))
+        
+        # Un evento alterado no verifica contra la raíz
+        alterado = auditoria.eventos[2]._replace(datos={'n': 99})
+        self.assertFalse(SistemaAuditoria.verificar_inclusion(alterado, auditoria.prueba_inclusion(2), raiz))
+    
+    def test_registrar_eventos_bulk(self):
+        """Probar el registro de varios eventos en una sola pasada"""
+        auditoria = SistemaAuditoria()
+        auditoria.registrar_evento('SETUP', {})
+        ultimo = auditoria.registrar_eventos_bulk(('VOTO', {'n': i}) for i in range(6))
+        
+        self.assertEqual(len(auditoria.eventos), 7)
+        self.assertEqual(ultimo, auditoria.eventos[-1].hash_actual)
+        self.assertTrue(auditoria.verificar_integridad())
+        
+        # El árbol actualizado en bloque coincide con el recalculado desde las hojas
+        raiz = auditoria.raiz_merkle()
+        self.assertEqual(raiz, SistemaAuditoria._calcular_raiz(auditoria.merkle_hojas))
+        for i, evento in enumerate(auditoria.eventos):
+            self.assertTrue(SistemaAuditoria.verificar_inclusion(evento, auditoria.prueba_inclusion(i), raiz))
+
+class TestSecurityParameters(unittest.TestCase):
+    """Prueba de extremo a extremo con parámetros de 256 bits"""
+    
+    def test_roundtrip_256_bits(self):
+        """Probar cifrado, prueba NIZK y recuento con un primo de 256 bits"""
+        system = ElGamalSystem(bits=256)
+        with _shared_prime():
+            public_key, _ = system.generate_keys()
+        self.assertEqual(public_key.p.bit_length(), 256)
+        
+        votes = [1, 0, 1]
+        ciphertexts = []
+        for vote in votes:
+            ciphertext, randomness = system.encrypt(vote)
+            proof = NIZKSystem.generate_proof(vote, ciphertext, randomness, public_key)
+            self.assertTrue(NIZKSystem.verify_proof(ciphertext, proof, public_key))
+            ciphertexts.append(ciphertext)
+        
+        aggregated = system.homomorphic_add(ciphertexts)
+        self.assertEqual(system.decrypt_sum(aggregated, len(votes)), sum(votes))
 
 
-def run_tests():
-    """Ejecuta todas las pruebas"""
-    # Crear suite de pruebas
-    loader = unittest.TestLoader()
-    suite = unittest.TestSuite()
+class _TimedResult(unittest.TextTestResult):
+    """Resultado que además mide el tiempo de cada prueba"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.timings = {}
+        self._start = {}
+    
+    def startTest(self, test):
+        self._start[test.id()] = time.perf_counter()
+        super().startTest(test)
+    
+    def stopTest(self, test):
+        super().stopTest(test)
+        self.timings[test.id()] = time.perf_counter() - self._start.pop(test.id())
+
+
+# Clases de prueba en el orden en que se ejecutan
+TEST_CASES = (
+    TestCryptoUtils,
+    TestElGamal,
+    TestNIZK,
+    TestTokenSystem,
+    TestVotingSystem,
+    TestMixnet,
+    TestAuditoria,
+    TestSecurityParameters,
+)
+
+
+def run_tests(shard=None):
+    """
+    Ejecuta todas las pruebas
     
-    # Agregar todas las clases de prueba
-    suite.addTests(loader.loadTestsFromTestCase(TestCryptoUtils))
-    suite.addTests(loader.loadTestsFromTestCase(TestElGamal))
-    suite.addTests(loader.loadTestsFromTestCase(TestNIZK))
-    suite.addTests(loader.loadTestsFromTestCase(TestTokenSystem))
-    suite.addTests(loader.loadTestsFromTestCase(TestVotingSystem))
-    suite.addTests(loader.loadTestsFromTestCase(TestMixnet))
-    suite.addTests(loader.loadTestsFromTestCase(TestAuditoria))
+    Args:
+        shard: Tupla (i, n) opcional: ejecuta solo las clases i, i+n, i+2n...
+               de TEST_CASES, para repartir la suite entre n procesos de CI
+    """
+    cases = TEST_CASES if shard is None else TEST_CASES[shard[0]::shard[1]]
+    
+    # Crear suite de pruebas con las clases seleccionadas
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite(loader.loadTestsFromTestCase(case) for case in cases)
     
     # Ejecutar pruebas
-    runner = unittest.TextTestRunner(verbosity=2)
+    runner = unittest.TextTestRunner(verbosity=2, resultclass=_TimedResult)
     result = runner.run(suite)
+    lentas = sorted(result.timings.items(), key=lambda kv: -kv[1])
     
     # Mostrar resumen
     print("\n" + "="*70)
@@ -433,12 +861,26 @@ def run_tests():
     print(f"Exitosas: {result.testsRun - len(result.failures) - len(result.errors)}")
     print(f"Fallos: {len(result.failures)}")
     print(f"Errores: {len(result.errors)}")
+    print("\nPruebas más lentas:")
+    for test_id, segundos in lentas[:5]:
+        print(f"  {segundos * 1000:8.1f} ms  {test_id.split('.', 1)[1]}")
     print("="*70)
     
+    # Perfil completo opcional: TEST_TIMINGS=ruta.json
+    ruta = os.environ.get("TEST_TIMINGS")
+    if ruta:
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump(lentas, f, indent=2)
+    
     return result.wasSuccessful()
 
 
 if __name__ == "__main__":
     import sys
-    success = run_tests()
+    # Uso: python test_voting_system.py [--shard i/n]
+    shard = None
+    if "--shard" in sys.argv:
+        i, n = sys.argv[sys.argv.index("--shard") + 1].split("/")
+        shard = (int(i), int(n))
+    success = run_tests(shard)
     sys.exit(0 if success else 1)
@@ -50,15 +50,10 @@ def test_crypto_utils():
         return False
 
 
-def test_elgamal():
+def test_elgamal(system):
     """Prueba básica del sistema ElGamal"""
     print("Probando ElGamal...", end=" ")
     try:
-        from elgamal import ElGamalSystem
-        
-        system = ElGamalSystem(bits=128)
-        system.generate_keys()
-        
         # Cifrar y descifrar
         ct_0, _ = system.encrypt(0)
         ct_1, _ = system.encrypt(1)
@@ -84,15 +79,13 @@ def test_elgamal():
         return False
 
 
-def test_nizk():
+def test_nizk(system):
     """Prueba básica de pruebas NIZK"""
     print("Probando NIZK...", end=" ")
     try:
-        from elgamal import ElGamalSystem
         from nizk import NIZKSystem
         
-        system = ElGamalSystem(bits=128)
-        pk, _ = system.generate_keys()
+        pk = system.public_key
         
         # Generar y verificar prueba para 0
         ct, rand = system.encrypt(0)
@@ -141,20 +134,19 @@ def test_tokens():
         return False
 
 
-def test_voting_system():
+def test_voting_system(authority):
     """Prueba básica del sistema completo"""
     print("Probando sistema de votación...", end=" ")
     try:
-        from voting_system import VotingAuthority, Voter, VotingCenter, TallyingCenter
+        from voting_system import Voter, VotingCenter, TallyingCenter
         
-        authority = VotingAuthority(bits=128)
-        pk = authority.setup_election()
+        pk = authority.public_key
         
         # Registrar votantes
         tokens = authority.register_voters(["Alice", "Bob"])
         
         # Centro de votación
-        vc = VotingCenter(authority.token_system, pk)
+        vc = VotingCenter(authority.token_system, pk, authority.auditoria)
         
         # Votar
         alice = Voter("Alice", tokens["Alice"])
@@ -166,7 +158,7 @@ def test_voting_system():
         assert vc.receive_vote(vote_bob)
         
         # Contar
-        tc = TallyingCenter(authority.elgamal)
+        tc = TallyingCenter(authority.elgamal, authority.auditoria, pk)
         yes, no = tc.tally_votes(vc.get_valid_votes())
         
         assert yes == 1
@@ -189,24 +181,32 @@ def main():
     
     start_time = time.time()
     
+    # Una sola autoridad (y un solo par de claves) para todas las pruebas
+    from voting_system import VotingAuthority
+    authority = VotingAuthority(bits=128)
+    authority.setup_election()
+    
     tests = [
         ("Imports", test_imports),
         ("Utilidades Criptográficas", test_crypto_utils),
-        ("Cifrado ElGamal", test_elgamal),
-        ("Pruebas NIZK", test_nizk),
+        ("Cifrado ElGamal", lambda: test_elgamal(authority.elgamal)),
+        ("Pruebas NIZK", lambda: test_nizk(authority.elgamal)),
         ("Sistema de Tokens", test_tokens),
-        ("Sistema Completo", test_voting_system)
+        ("Sistema Completo", lambda: test_voting_system(authority))
     ]
     
     results = []
+    times = {}
     
     for name, test_func in tests:
+        t = time.perf_counter()
         try:
             result = test_func()
             results.append((name, result))
         except Exception as e:
             print(f"Error crítico en {name}: {e}")
             results.append((name, False))
+        times[name] = time.perf_counter() - t
     
     elapsed = time.time() - start_time
     
@@ -219,13 +219,18 @@ def main():
     
     for name, result in results:
         status = "✓ PASS" if result else "✗ FAIL"
-        print(f"  {name:<30} {status}")
+        print(f"  {name:<30} {status}  {times[name] * 1000:8.1f} ms")
     
     print("\n" + "-"*70)
     print(f"  Total: {passed}/{total} pruebas pasadas")
     print(f"  Tiempo: {elapsed:.2f} segundos")
     print("-"*70)
     
+    lentas = sorted(times.items(), key=lambda kv: -kv[1])
+    print("\n  Verificaciones más lentas:")
+    for name, segundos in lentas:
+        print(f"  {segundos * 1000:8.1f} ms  {name}")
+    
     if passed == total:
         print("\n✓ ¡Sistema verificado correctamente!")
         print("  Puedes ejecutar 'python3 main.py' para la demostración completa.")